@@ -0,0 +1,208 @@
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+from enduro.recording import ReplayALE
+from enduro.state import EnvironmentState, StateExtractor
+from q_agent import QAgent
+
+
+# The stages of StateExtractor.run(), in order
+STAGES = ["getScreenImage", "classifyPixels", "detectRoadGrid",
+          "getRoadMask", "detectCars", "getStateGrid"]
+
+
+class Benchmark(object):
+    def __init__(self, recording, frames=1000, repeat=3, preallocate=False):
+        """ Times the extraction and training hot paths on recorded frames,
+        see enduro.recording.
+
+        Args:
+            recording (str): The recording to replay.
+            frames (int): The number of frames to time every stage on.
+            repeat (int): The number of passes over the frames. The best
+                          pass of every stage is kept.
+            preallocate (bool): Whether the extractor preallocates its
+                                arrays.
+        """
+        self._recording = recording
+        self._frames = frames
+        self._repeat = repeat
+        self._preallocate = preallocate
+        self._clock = timeit.default_timer
+
+    def __time(self, times, name, function, *args):
+        start = self._clock()
+        result = function(*args)
+        times[name].append(self._clock() - start)
+        return result
+
+    def __pass(self, agent):
+        """ Times every stage once on every frame.
+        """
+        ale = ReplayALE(self._recording, loop=True)
+        extractor = StateExtractor(ale, preallocate=self._preallocate)
+        times = dict((name, []) for name in
+                     STAGES + ["draw", "buildState", "learn"])
+        time = self.__time
+        actions = agent.getActionsSet()
+
+        for i in range(self._frames):
+            screen = time(times, "getScreenImage",
+                          extractor._getScreenImage)
+            (road, player, others) = time(times, "classifyPixels",
+                                          extractor._classifyPixels, screen)
+            road_grid = time(times, "detectRoadGrid",
+                             extractor._StateExtractor__detectRoadGrid, road)
+            mask = time(times, "getRoadMask",
+                        extractor._StateExtractor__getRoadMask,
+                        road, road_grid)
+            cars = time(times, "detectCars",
+                        extractor._StateExtractor__detectCars,
+                        player, others, mask)
+            grid = time(times, "getStateGrid",
+                        extractor._StateExtractor__getStateGrid,
+                        road_grid, cars, road.shape)
+
+            time(times, "draw", EnvironmentState.draw, grid)
+            agent.next_state = time(times, "buildState", agent.buildState,
+                                    grid)
+            if i:
+                time(times, "learn", agent.learn)
+            agent.state = agent.next_state
+            agent.action = actions[i % len(actions)]
+            agent.reward = ale.act(agent.action)
+
+        return times
+
+    def __allocations(self):
+        """ Counts the frame sized arrays which the extractor allocates per
+        frame once it has seen every frame, e.g. none when preallocating.
+        """
+        ale = ReplayALE(self._recording, loop=True)
+        extractor = StateExtractor(ale, preallocate=self._preallocate)
+        for i in range(2 * self._frames):
+            if i == self._frames:
+                start = extractor.allocations
+            extractor.run(image=False)
+            ale.act(0)
+        return (extractor.allocations - start) / float(self._frames)
+
+    def __endToEnd(self, episodes):
+        """ Times QAgent.run() while learning, without its reporting.
+        """
+        agent = QAgent(ale=ReplayALE(self._recording, loop=True))
+        steps = [0]
+
+        def callback(learn, episode, iteration):
+            steps[0] += 1
+        agent.callback = callback
+
+        start = self._clock()
+        agent.run(True, episodes=episodes, headless=True)
+        elapsed = self._clock() - start
+        return {"steps": steps[0],
+                "steps_per_s": steps[0] / elapsed,
+                "frames_per_s": episodes * 6500 / elapsed}
+
+    def run(self, episodes=1):
+        """ Runs the benchmark.
+
+        Returns:
+            dict: The median and best mean latency of every stage, in
+                  microseconds, the frame sized arrays allocated per frame
+                  in the steady state and the end-to-end throughput.
+        """
+        agent = QAgent(ale=ReplayALE(self._recording, loop=True))
+        passes = [self.__pass(agent) for r in range(self._repeat)]
+
+        stages = {}
+        for name in passes[0]:
+            times = np.asarray([p[name] for p in passes]) * 1e6
+            stages[name] = {
+                "median_us": float(np.median(times)),
+                "mean_us": float(np.min(np.mean(times, axis=1)))}
+
+        return {
+            "recording": self._recording,
+            "frames": self._frames,
+            "preallocate": self._preallocate,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "stages": stages,
+            "allocations_per_frame": self.__allocations(),
+            "end_to_end": self.__endToEnd(episodes)}
+
+    @staticmethod
+    def compare(results, baseline, threshold=0.1):
+        """ Returns the regressions of the results over a baseline.
+
+        Args:
+            results (dict): The results of Benchmark.run().
+            baseline (dict): The results of an earlier revision.
+            threshold (float): The relative slowdown which is a regression.
+
+        Returns:
+            list: The (name, baseline, result) of every regression.
+        """
+        regressions = []
+        for (name, stage) in sorted(results["stages"].items()):
+            old = baseline["stages"].get(name)
+            if old and stage["median_us"] > (1 + threshold) * old["median_us"]:
+                regressions.append((name, old["median_us"],
+                                    stage["median_us"]))
+
+        (new, old) = (results["end_to_end"]["steps_per_s"],
+                      baseline["end_to_end"]["steps_per_s"])
+        if new * (1 + threshold) < old:
+            regressions.append(("steps_per_s", old, new))
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the extraction and training hot paths on a "
+                    "recording, see enduro.recording.")
+    parser.add_argument("recording")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--episodes", type=int, default=1)
+    parser.add_argument("--preallocate", action="store_true")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline",
+                        help="the results of an earlier revision to compare "
+                             "with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the relative slowdown which fails the "
+                             "benchmark")
+    args = parser.parse_args()
+
+    results = Benchmark(args.recording, args.frames, args.repeat,
+                        args.preallocate).run(args.episodes)
+    json.dump(results, open(args.output, "w"), indent=2, sort_keys=True)
+
+    for (name, stage) in sorted(results["stages"].items()):
+        print "{0:16} {1:10.1f}us".format(name, stage["median_us"])
+    print "{0:16} {1:10.1f}".format("steps/s",
+                                    results["end_to_end"]["steps_per_s"])
+    print "{0:16} {1:10.2f}".format("allocations/frame",
+                                    results["allocations_per_frame"])
+    if args.preallocate and results["allocations_per_frame"] > 0:
+        print >> sys.stderr, "the extractor allocates frame sized arrays " \
+            "in the steady state"
+        sys.exit(1)
+
+    if args.baseline:
+        regressions = Benchmark.compare(
+            results, json.load(open(args.baseline)), args.threshold)
+        for (name, old, new) in regressions:
+            print >> sys.stderr, "REGRESSION {0}: {1:.1f} -> {2:.1f}".format(
+                name, old, new)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from enduro.agent import Agent
+from enduro.ram import RamDecoder
+
+
+class CalibrationAgent(Agent):
+    def __init__(self):
+        super(CalibrationAgent, self).__init__()
+        # RAM snapshots and the matching grids of the vision pipeline
+        self.rams = []
+        self.grids = []
+
+        self.idx2act = {i: a for i, a in enumerate(self.getActionsSet())}
+
+    def initialise(self, grid):
+        self.sense(grid)
+
+    def act(self):
+        # Mostly accelerate so that many opponents are met
+        idx = np.random.choice(4, p=[0.7, 0.1, 0.1, 0.1])
+        self.move(self.idx2act[idx])
+
+    def sense(self, grid):
+        self.rams.append(self._ale.getRAM())
+        self.grids.append(np.copy(grid))
+
+    def learn(self):
+        pass
+
+    def callback(self, learn, episode, iteration):
+        if not iteration % 1000:
+            print "{0}/{1}: {2} frames".format(episode, iteration, len(self.rams))
+
+
+if __name__ == "__main__":
+    a = CalibrationAgent()
+    a.run(False, episodes=4)
+
+    # Fit on the first three episodes and validate on the last one
+    rams = np.asarray(a.rams)
+    grids = np.asarray(a.grids)
+    n = 3 * len(rams) // 4
+    decoder = RamDecoder.fit(rams[:n], grids[:n])
+    print 'Validation: ' + str(decoder.validate(rams[n:], grids[n:]))
+    decoder.save('ram_decoder.npz')
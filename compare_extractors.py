@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+import numpy as np
+
+from enduro.palette import PaletteStateExtractor
+from enduro.recording import ReplayALE
+from enduro.state import StateExtractor
+
+
+def compareExtractors(recording, extractor, reference=StateExtractor):
+    """ Runs two extractors on every frame of a recording, see
+    enduro.recording.
+
+    Args:
+        recording (str): The recording to replay.
+        extractor (callable): Builds the extractor to check, see Agent.
+        reference (callable): Builds the extractor it should agree with.
+
+    Returns:
+        (int, list): The number of frames and the frames whose grids differ.
+    """
+    ale = ReplayALE(recording)
+    (extractor, reference) = (extractor(ale), reference(ale))
+    mismatches = []
+    for i in range(len(ale)):
+        (grid, _) = extractor.run(image=False)
+        (expected, _) = reference.run(image=False)
+        if not np.array_equal(grid, expected):
+            mismatches.append(i)
+        if i + 1 < len(ale):
+            ale.act(0)
+    return (len(ale), mismatches)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Checks that the palette backend extracts the same grids "
+                    "as the RGB one on every frame of a recording.")
+    parser.add_argument("recording")
+    args = parser.parse_args()
+
+    (frames, mismatches) = compareExtractors(args.recording,
+                                             PaletteStateExtractor)
+    print "{0}/{1} frames differ".format(len(mismatches), frames)
+    if mismatches:
+        print >> sys.stderr, "first frames which differ: {0}".format(
+            mismatches[:10])
+        sys.exit(1)
@@ -1,54 +1,192 @@
+import sys
+
 from ale_python_interface import ALEInterface
 from enduro.action import Action
+from enduro.checkpoint import restoreEmulator, saveEmulator
 from enduro.control import Controller
+from enduro.recording import Recorder
 from enduro.state import StateExtractor
 
 
 class Agent(object):
-    def __init__(self):
-        self._ale = ALEInterface()
-        self._ale.setInt('random_seed', 123)
-        self._ale.setFloat('repeat_action_probability', 0.0)
-        self._ale.setBool('color_averaging', False)
-        self._ale.loadROM('roms/enduro.bin')
-        self._controller = Controller(self._ale)
-        self._extractor = StateExtractor(self._ale)
-        self._image = None
-
-    def run(self, learn, episodes=1, draw=False):
+    def __init__(self, extractor=StateExtractor, schedule=None, repeat=8,
+                 max_pool=False, seed=123, ale=None, record=None,
+                 frame_skip=None):
+        """ Sets up the emulator, the action controller and the extractor
+        of the environment grid.
+
+        Args:
+            extractor (callable): Builds the environment grid extractor
+                                  from the ALE interface, e.g. StateExtractor,
+                                  PaletteStateExtractor or RamStateExtractor.
+            schedule (dict): The number of frames each action is repeated
+                             for, see Controller.SCHEDULE.
+            repeat (int): The number of frames the other actions are
+                          repeated for.
+            max_pool (bool): Whether to extract the grid from the maximum of
+                             the last two frames of each action. Only
+                             supported by the RGB extractor.
+            seed (int): The random seed of the emulator.
+            ale (ALEInterface): The emulator to use instead of a new one,
+                                e.g. a ReplayALE. Its settings are left
+                                untouched.
+            record (str): The file to record the played frames to, see
+                          enduro.recording.
+            frame_skip (int): The number of frames each act() call of the
+                              emulator advances. By default, the 'frame_skip'
+                              setting of the given emulator, or for a new
+                              emulator or a replay, 1 when max pooling and
+                              the largest one the schedule allows otherwise.
+        """
+        # The given emulator repeats the actions as it was set up to. A
+        # replay has no such setting, each act() call is one recorded call.
+        if frame_skip is None and ale is not None and hasattr(ale, "getInt"):
+            frame_skip = ale.getInt('frame_skip')
+        # Let the emulator repeat the actions natively, unless the last two
+        # frames of each action are needed
+        if frame_skip is None:
+            frame_skip = 1 if max_pool else \
+                Controller.frameSkip(schedule, repeat)
+
+        self._ale = Agent.createEmulator(seed, frame_skip) if ale is None \
+            else ale
+        if record is not None:
+            self._ale = Recorder(self._ale, record)
+        self._controller = Controller(
+            self._ale, schedule, repeat, frame_skip, max_pool)
+        self._extractor = extractor(
+            self._controller if max_pool else self._ale)
+        self._frame = None
+        self._sink = None
+
+    @staticmethod
+    def createEmulator(seed=123, frame_skip=1):
+        """ Loads Enduro in a new emulator.
+
+        Args:
+            seed (int): The random seed of the emulator.
+            frame_skip (int): The number of frames each act() call advances.
+
+        Returns:
+            ALEInterface: The emulator.
+        """
+        ale = ALEInterface()
+        ale.setInt('random_seed', seed)
+        ale.setInt('frame_skip', frame_skip)
+        ale.setFloat('repeat_action_probability', 0.0)
+        ale.setBool('color_averaging', False)
+        ale.loadROM('roms/enduro.bin')
+        return ale
+
+    def run(self, learn, episodes=1, draw=False, headless=False,
+            render_steps=1, render_episodes=1, profiler=None, sink=None,
+            checkpoint=None):
         """ Implements the playing/learning loop.
 
         Args:
             learn(bool): Whether the self.learn() function should be called.
             episodes (int): The number of episodes to run the agent for.
             draw (bool): Whether to overlay the environment state on the frame.
+            headless (bool): Whether to skip rendering altogether, in which
+                             case no frame is ever converted nor kept.
+            render_steps (int): Render one step in every render_steps of the
+                                rendered episodes.
+            render_episodes (int): Render one episode in every
+                                   render_episodes.
+            profiler (Profiler): Times the phases of every step, see
+                                 enduro.instrument. Nothing is timed if None.
+            sink (RenderSink): Receives the grid and the frame of the
+                               rendered steps, and the reports, to output
+                               them on a background thread, see enduro.sink.
+            checkpoint (Checkpoint): Saves the training state every few
+                                     episodes, see enduro.checkpoint. The run
+                                     resumes from it if it was saved already,
+                                     with the episodes left.
 
         Returns:
             None
         """
-        for e in range(episodes):
+        (act, observe, sense, learn_, render, callback) = (
+            self.act, self.__observe, self.sense, self.learn, self.render,
+            self.callback)
+
+        self._sink = sink
+        if sink is not None:
+            def render(grid, episode, iteration):
+                self.render(grid, episode, iteration)
+                sink.submit(episode, iteration, grid, self._frame)
+
+        if profiler is not None:
+            # act() includes the emulation of the action
+            (act, observe, sense, learn_, render, callback) = (
+                profiler.wrap("act", act),
+                profiler.wrap("extract", observe),
+                profiler.wrap("sense", sense),
+                profiler.wrap("learn", learn_),
+                profiler.wrap("render", render),
+                profiler.wrap("callback", callback))
+
+        start = 0 if checkpoint is None else checkpoint.restore(self)
+        for e in range(start, episodes):
+            rendered = not headless and not (e + 1) % render_episodes
+
             # Observe the environment to set the initial state
-            (grid, self._image) = self._extractor.run(draw=draw, scale=4.0)
+            grid = observe(draw, rendered)
             self.initialise(grid)
+            if rendered:
+                render(grid, e + 1, 0)
 
             num_frames = self._ale.getFrameNumber()
+            step = 0
+            if profiler is not None:
+                profiler.reset()
 
             # Each episode lasts 6500 frames
             while self._ale.getFrameNumber() - num_frames < 6500:
+                step += 1
+                rendering = rendered and not step % render_steps
+
                 # Take an action
-                self.act()
+                act()
 
                 # Update the environment grid
-                (grid, self._image) = self._extractor.run(draw=draw, scale=4.0)
-                self.sense(grid)
+                grid = observe(draw, rendering)
+                sense(grid)
 
                 # Perform learning if required
                 if learn:
-                    self.learn()
+                    learn_()
 
-                self.callback(learn, e + 1, self._ale.getFrameNumber() - num_frames)
+                iteration = self._ale.getFrameNumber() - num_frames
+                if rendering:
+                    render(grid, e + 1, iteration)
+                callback(learn, e + 1, iteration)
+                if profiler is not None:
+                    profiler.step(iteration)
             self._ale.reset_game()
 
+            if checkpoint is not None and \
+                    (not (e + 1) % checkpoint.interval or e + 1 == episodes):
+                checkpoint.save(self, e + 1)
+
+        if profiler is not None:
+            profiler.flush()
+
+    def __observe(self, draw, rendering):
+        """ Extracts the environment grid, and the frame only if it is going
+        to be rendered.
+        """
+        (grid, self._frame) = self._extractor.run(
+            draw=draw and rendering, scale=4.0, image=rendering, lazy=True)
+        return grid
+
+    @property
+    def _image(self):
+        """ The frame of the latest rendered step, which is only converted,
+        scaled and annotated when it is first read, or None.
+        """
+        return None if self._frame is None else self._frame.image()
+
     def getActionsSet(self):
         """ Returns the set of all possible actions
         """
@@ -66,6 +204,30 @@ class Agent(object):
         """
         return self._controller.move(action)
 
+    def report(self, text):
+        """ Prints a report, on the background thread of the sink of the run
+        if it has one.
+        """
+        if self._sink is not None:
+            self._sink.submit(None, None, text=text)
+        else:
+            sys.stdout.write(text + "\n")
+
+    def getCheckpoint(self):
+        """ Returns the training state to save in a checkpoint, see
+        enduro.checkpoint. Subclasses add their own state to it, e.g. their
+        Q table, hyperparameters and counters.
+
+        Returns:
+            dict: The picklable state, here the system state of the emulator.
+        """
+        return {"emulator": saveEmulator(self._ale)}
+
+    def setCheckpoint(self, state):
+        """ Restores the training state of a checkpoint, see getCheckpoint().
+        """
+        restoreEmulator(self._ale, state["emulator"])
+
     def initialise(self, grid):
         """ Called at the beginning of each episode, mainly used
         for state initialisation.
@@ -104,6 +266,20 @@ class Agent(object):
         """
         raise NotImplementedError
 
+    def render(self, grid, episode, iteration):
+        """ Called on the rendered steps, after learning, mainly for
+        visualisation purposes. self._image holds the latest frame.
+
+        Args:
+            grid (np.ndarray): 11x10 array with the latest environment grid.
+            episode (int): The number of the current episode.
+            iteration (int): The number of the current iteration.
+
+        Returns:
+            None
+        """
+        pass
+
     def callback(self, learn, episode, iteration):
         """ Called at each loop iteration mainly for reporting purposes.
 
@@ -0,0 +1,84 @@
+import os
+import pickle
+
+import numpy as np
+
+
+VERSION = 1
+
+
+def saveEmulator(ale):
+    """ Returns the serialised system state of an emulator, or None if it
+    cannot be saved, e.g. for a ReplayALE.
+    """
+    if not hasattr(ale, "cloneSystemState"):
+        return None
+    return ale.encodeState(ale.cloneSystemState())
+
+
+def restoreEmulator(ale, state):
+    """ Restores the system state of an emulator, see saveEmulator().
+    """
+    if state is not None:
+        ale.restoreSystemState(ale.decodeState(state))
+
+
+class Checkpoint(object):
+    """ Saves the training state of an agent every few episodes and restores
+    it, so that a run can resume where it stopped.
+
+    The checkpoint holds the number of episodes played, the np.random state
+    and whatever Agent.getCheckpoint() returns, which includes the system
+    state of the emulator. It is written to a temporary file which then
+    replaces the previous checkpoint, so that the file always holds a
+    complete one.
+    """
+
+    def __init__(self, path, interval=10):
+        """
+        Args:
+            path (str): The file of the checkpoint.
+            interval (int): The number of episodes between two checkpoints.
+        """
+        self.path = path
+        self.interval = interval
+
+    def save(self, agent, episodes):
+        """ Saves the state of an agent after a number of episodes.
+        """
+        state = {"version": VERSION,
+                 "episodes": episodes,
+                 "random": np.random.get_state(),
+                 "agent": agent.getCheckpoint()}
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, 2)
+            f.flush()
+            os.fsync(f.fileno())
+        # os.rename() does not replace files on Windows
+        getattr(os, "replace", os.rename)(tmp, self.path)
+
+    def load(self):
+        """ Returns the saved state, or None if there is no checkpoint yet.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != VERSION:
+            raise ValueError("{0} is not a checkpoint".format(self.path))
+        return state
+
+    def restore(self, agent):
+        """ Restores the saved state of an agent, if any.
+
+        Returns:
+            int: The number of episodes played so far.
+        """
+        state = self.load()
+        if state is None:
+            return 0
+        np.random.set_state(state["random"])
+        agent.setCheckpoint(state["agent"])
+        return state["episodes"]
@@ -1,15 +1,95 @@
+import numpy as np
+
 from enduro.action import Action
 
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
 
 class Controller:
-    def __init__(self, ale):
+    # Number of frames each action is repeated for, if not the default one
+    SCHEDULE = {Action.ACCELERATE: 4}
+
+    def __init__(self, ale, schedule=None, repeat=8, frame_skip=1,
+                 max_pool=False):
+        """ Executes actions on the emulator.
+
+        Args:
+            ale (ALEInterface): The emulator.
+            schedule (dict): The number of frames each action is repeated
+                             for, see Controller.SCHEDULE.
+            repeat (int): The number of frames the other actions are
+                          repeated for.
+            frame_skip (int): The number of frames the emulator advances on
+                              each act() call, i.e. its 'frame_skip' setting.
+                              Must divide all the repeats of the schedule.
+            max_pool (bool): Whether getScreenRGB() returns the maximum of
+                             the last two frames of the last action. Needs a
+                             frame_skip of 1.
+        """
         self._ale = ale
+        self._schedule = dict(Controller.SCHEDULE if schedule is None
+                              else schedule)
+        self._repeat = repeat
+        self._frame_skip = frame_skip
+        self._max_pool = max_pool
+
+        if Controller.frameSkip(schedule, repeat) % frame_skip:
+            raise ValueError("frame_skip must divide the number of repeats")
+        if max_pool and frame_skip != 1:
+            raise ValueError("max pooling needs a frame_skip of 1")
+
+        if max_pool:
+            [w, h] = ale.getScreenDims()
+            self._screens = np.zeros((3, h, w, 3), np.uint8)
+            self._pooled_frame = None
+
+    @staticmethod
+    def frameSkip(schedule=None, repeat=8):
+        """ Returns the largest emulator frame skip which can execute all
+        the repeats of a schedule.
+        """
+        schedule = Controller.SCHEDULE if schedule is None else schedule
+        for r in schedule.values():
+            repeat = gcd(repeat, r)
+        return repeat
 
     def move(self, action):
         reward = 0
-        repeat = 4 if action == Action.ACCELERATE else 8
+        calls = self._schedule.get(action, self._repeat) // self._frame_skip
+
+        if not self._max_pool:
+            for i in range(calls):
+                reward += self._ale.act(action)
+            return reward
 
-        for i in range(repeat):
+        for i in range(calls - 1):
             reward += self._ale.act(action)
+        self._ale.getScreenRGB(self._screens[0])
+        reward += self._ale.act(action)
+        self._ale.getScreenRGB(self._screens[1])
+        np.maximum(self._screens[0], self._screens[1], out=self._screens[2])
+        self._pooled_frame = self._ale.getFrameNumber()
 
         return reward
+
+    def getScreenDims(self):
+        return self._ale.getScreenDims()
+
+    def getFrameNumber(self):
+        return self._ale.getFrameNumber()
+
+    def getScreenRGB(self, screen_data=None):
+        """ Returns the max pooled screen of the last action, or the current
+        screen if the emulator has moved since, e.g. on a new episode.
+        """
+        if not self._max_pool or \
+                self._pooled_frame != self._ale.getFrameNumber():
+            return self._ale.getScreenRGB(screen_data)
+
+        if screen_data is None:
+            return np.copy(self._screens[2])
+        np.copyto(screen_data, self._screens[2])
+        return screen_data
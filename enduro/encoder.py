@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class StateEncoder(object):
+    """ Maps environment grids to flat integer state indices, e.g. the rows
+    of a Q table.
+
+    Subclasses implement encodeBatch() with array operations over a stack
+    of grids, and set size to the number of states.
+    """
+
+    size = None
+
+    def encode(self, grid):
+        """ Returns the state index of an 11x10 environment grid.
+        """
+        return int(self.encodeBatch(np.asarray(grid)[None])[0])
+
+    def encodeBatch(self, grids):
+        """ Returns the state indices of Nx11x10 environment grids.
+        """
+        raise NotImplementedError
+
+
+class ClosestOpponentEncoder(StateEncoder):
+    """ The state of QAgent: the agent's column and the column of the first
+    opponent on the closest row where any is present, offset by 1 since 0
+    means that no opponent is present. The index of column x and opponent
+    opp is x * (grid_cols + 1) + opp, the flat index of a
+    grid_cols x (grid_cols + 1) table.
+    """
+
+    def __init__(self, grid_cols=10, horizon_row=None):
+        """
+        Args:
+            grid_cols (int): The number of columns of the grid.
+            horizon_row (int): The number of rows of the grid which opponents
+                               are looked for on, all of them if None.
+        """
+        self.grid_cols = grid_cols
+        self.horizon_row = horizon_row
+        self.size = grid_cols * (grid_cols + 1)
+
+    def encode(self, grid):
+        grid = np.asarray(grid)
+        x = np.argmax(grid[0] == 2)
+        # The first opponent in row order is on the closest row
+        opponents = grid[:self.horizon_row].ravel() == 1
+        first = np.argmax(opponents)
+        opp = first % self.grid_cols + 1 if opponents[first] else 0
+        return int(x * (self.grid_cols + 1) + opp)
+
+    def encodeBatch(self, grids):
+        grids = np.asarray(grids)
+
+        # Agent position (assumes the agent is always on row 0)
+        x = np.argmax(grids[:, 0, :] == 2, axis=1)
+
+        # The first opponent in row order is on the closest row, offset by 1
+        # since 0 means that no opponent is present
+        opponents = grids[:, :self.horizon_row].reshape(len(grids), -1) == 1
+        first = np.argmax(opponents, axis=1)
+        opp = np.where(opponents[np.arange(len(grids)), first],
+                       first % self.grid_cols + 1, 0)
+
+        return x * (self.grid_cols + 1) + opp
+
+
+class GridRowsEncoder(StateEncoder):
+    """ The closest rows of the grid, the player's included, as the digits
+    of a base 3 number, one per cell. There are far too many states for a
+    dense table beyond a row or so, see enduro.qtable.HashedQTable.
+    """
+
+    def __init__(self, rows=2, grid_cols=10):
+        """
+        Args:
+            rows (int): The number of rows of the state.
+            grid_cols (int): The number of columns of the grid.
+        """
+        if rows * grid_cols > 39:
+            raise ValueError("the states of more than 39 cells do not fit "
+                             "in 64 bit integers")
+        self.rows = rows
+        self.size = 3 ** (rows * grid_cols)
+        self._digits = 3 ** np.arange(rows * grid_cols, dtype=np.int64)
+
+    def encode(self, grid):
+        return int(np.dot(np.asarray(grid)[:self.rows].ravel(), self._digits))
+
+    def encodeBatch(self, grids):
+        grids = np.asarray(grids)[:, :self.rows]
+        return np.dot(grids.reshape(len(grids), -1).astype(np.int64),
+                      self._digits)
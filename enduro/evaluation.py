@@ -0,0 +1,95 @@
+import numpy as np
+
+from enduro.agent import Agent
+from enduro.checkpoint import restoreEmulator
+from enduro.control import Controller
+from enduro.state import StateExtractor
+
+
+def greedyPolicy(Q, actions):
+    """ Freezes the greedy policy of a Q table.
+
+    Args:
+        Q (np.ndarray): The Q table, indexed by the states then the actions.
+        actions (list): The ALE action of every action index.
+
+    Returns:
+        np.ndarray: The ALE action of every flat state index.
+    """
+    return np.asarray(actions)[np.argmax(Q.reshape(-1, Q.shape[-1]), axis=1)]
+
+
+class PolicyEvaluator(object):
+    """ Plays a frozen policy, without any learning, exploration, logging or
+    rendering, and measures its total reward.
+    """
+
+    def __init__(self, policy, encode, extractor=StateExtractor,
+                 schedule=None, repeat=8):
+        """
+        Args:
+            policy (np.ndarray): The ALE action of every state index, see
+                                 greedyPolicy().
+            encode (callable): Maps an environment grid to its state index.
+            extractor (callable): Builds the environment grid extractor, see
+                                  Agent.
+            schedule (dict): The number of frames each action is repeated
+                             for, see Controller.SCHEDULE.
+            repeat (int): The number of frames the other actions are
+                          repeated for.
+        """
+        self._policy = policy
+        self._encode = encode
+        self._extractor = extractor
+        self._schedule = schedule
+        self._repeat = repeat
+
+    def run(self, episodes=10, seeds=(123,), start=None):
+        """ Plays the policy for a number of episodes with every emulator
+        seed.
+
+        Args:
+            episodes (int): The number of episodes per seed.
+            seeds (list): The random seeds of the emulators.
+            start (np.ndarray): The emulator state every episode starts from,
+                                see enduro.checkpoint.saveEmulator(), rather
+                                than the start of a race.
+
+        Returns:
+            np.ndarray: The total reward of every seed and episode.
+        """
+        frame_skip = Controller.frameSkip(self._schedule, self._repeat)
+        rewards = np.zeros((len(seeds), episodes))
+        (policy, encode) = (self._policy, self._encode)
+
+        for (i, seed) in enumerate(seeds):
+            ale = Agent.createEmulator(seed, frame_skip)
+            move = Controller(ale, self._schedule, self._repeat,
+                              frame_skip).move
+            extractor = self._extractor(ale)
+
+            for e in range(episodes):
+                restoreEmulator(ale, start)
+                num_frames = ale.getFrameNumber()
+                total = 0
+
+                # Each episode lasts 6500 frames
+                while ale.getFrameNumber() - num_frames < 6500:
+                    (grid, _) = extractor.run(image=False)
+                    total += move(policy[encode(grid)])
+
+                rewards[i, e] = total
+                ale.reset_game()
+
+        return rewards
+
+    @staticmethod
+    def summary(rewards):
+        """ Returns the mean total reward of a run() and the half width of
+        its 95% confidence interval, 1.96 standard errors.
+        """
+        rewards = np.ravel(rewards)
+        if len(rewards) < 2:
+            return (float(np.mean(rewards)), float("nan"))
+        return (float(np.mean(rewards)),
+                1.96 * float(np.std(rewards, ddof=1)) / np.sqrt(len(rewards)))
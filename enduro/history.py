@@ -0,0 +1,214 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+# The file starts with the magic number, the version and the number of
+# dimensions of the Q table snapshots, followed by each dimension. The chunks
+# follow, each starting with its kind and its number of steps. Steps chunks
+# hold that many step records. An episode chunk ends an episode of that many
+# steps, which are in the steps chunks since the previous episode chunk, and
+# holds its total reward and a snapshot of the Q table.
+MAGIC = b"ELOG"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sII")
+DIMENSION = struct.Struct("<I")
+CHUNK_HEADER = struct.Struct("<II")
+TOTAL = struct.Struct("<d")
+STEP = np.dtype([("iteration", "<i4"), ("reward", "<f8")])
+
+STEPS = 1
+EPISODE = 2
+
+
+class LogWriter(object):
+    """ Streams the training log to an append-only file: the total reward
+    after every step, and the Q table at the end of every episode.
+
+    Only a chunk of steps is kept in memory. The file is flushed at the end
+    of every episode, so that all the finished episodes are on disk.
+    """
+
+    def __init__(self, path, shape=(), chunk_steps=8192, append=False):
+        """
+        Args:
+            path (str): The file to write.
+            shape (tuple): The shape of the Q table, () to keep no snapshots.
+            chunk_steps (int): The number of steps of a chunk.
+            append (bool): Whether to add to the log in the file, if any,
+                           e.g. when resuming from a checkpoint.
+        """
+        self._shape = tuple(int(d) for d in shape)
+        self._steps = np.zeros(chunk_steps, STEP)
+        self._size = 0
+        self._episode_steps = 0
+        self._total = 0.
+
+        if append and os.path.exists(path):
+            self._file = open(path, "r+b")
+            self._file.seek(0, os.SEEK_END)
+            return
+
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, len(self._shape)))
+        for d in self._shape:
+            self._file.write(DIMENSION.pack(d))
+
+    def step(self, iteration, reward):
+        """ Logs a step of the current episode.
+
+        Args:
+            iteration (int): The number of the iteration.
+            reward (float): The total reward so far in the episode.
+        """
+        record = self._steps[self._size]
+        record["iteration"] = iteration
+        record["reward"] = reward
+        self._size += 1
+        self._episode_steps += 1
+        self._total = reward
+        if self._size == len(self._steps):
+            self.__flushSteps()
+
+    def __flushSteps(self):
+        if not self._size:
+            return
+        self._file.write(CHUNK_HEADER.pack(STEPS, self._size))
+        self._file.write(self._steps[:self._size].tobytes())
+        self._size = 0
+
+    def endEpisode(self, Q=None):
+        """ Ends the current episode.
+
+        Args:
+            Q (np.ndarray): The Q table, if the log keeps snapshots.
+        """
+        self.__flushSteps()
+        self._file.write(CHUNK_HEADER.pack(EPISODE, self._episode_steps))
+        self._file.write(TOTAL.pack(self._total))
+        if self._shape:
+            self._file.write(np.ascontiguousarray(
+                Q, "<f8").reshape(self._shape).tobytes())
+        self._file.flush()
+        self._episode_steps = 0
+        self._total = 0.
+
+    def tell(self):
+        """ Returns the size of the log written so far, which ends with the
+        last finished episode when called between episodes.
+        """
+        return self._file.tell()
+
+    def truncate(self, size):
+        """ Drops the log past a size returned by tell(), e.g. the episodes
+        played after a checkpoint.
+        """
+        (self._size, self._episode_steps, self._total) = (0, 0, 0.)
+        self._file.seek(size)
+        self._file.truncate()
+
+    def write(self, iterations, rewards, Q=None):
+        """ Logs a whole episode, e.g. an entry of QAgent.log.
+        """
+        for (iteration, reward) in zip(iterations, rewards):
+            self.step(iteration, reward)
+        self.endEpisode(Q)
+
+    def close(self):
+        self.__flushSteps()
+        self._file.close()
+
+
+class LogReader(object):
+    """ Reads a training log written by LogWriter, without loading it.
+
+    The file is memory mapped and only the chunk headers are read up front.
+    The steps and the Q tables returned are read-only views of the file.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The log.
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, ndim) = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} is not a training log".format(path))
+        offset = FILE_HEADER.size
+        self.shape = tuple(
+            DIMENSION.unpack_from(self._map, offset + i * DIMENSION.size)[0]
+            for i in range(ndim))
+        offset += ndim * DIMENSION.size
+        q_size = int(np.prod(self.shape)) * 8 if self.shape else 0
+
+        # Index the episodes. An episode cut short, e.g. by a crash, ends
+        # the log.
+        self._episodes = []
+        totals = []
+        steps = []
+        while offset + CHUNK_HEADER.size <= len(self._map):
+            (kind, n) = CHUNK_HEADER.unpack_from(self._map, offset)
+            offset += CHUNK_HEADER.size
+            if kind == STEPS:
+                if offset + n * STEP.itemsize > len(self._map):
+                    break
+                steps.append((offset, n))
+                offset += n * STEP.itemsize
+            elif kind == EPISODE:
+                if offset + TOTAL.size + q_size > len(self._map):
+                    break
+                totals.append(TOTAL.unpack_from(self._map, offset)[0])
+                self._episodes.append((steps, offset + TOTAL.size))
+                steps = []
+                offset += TOTAL.size + q_size
+            else:
+                raise ValueError("{0} is corrupt".format(path))
+
+        self.totals = np.asarray(totals)
+
+    def __len__(self):
+        return len(self._episodes)
+
+    def episode(self, i):
+        """ Returns an episode.
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): The iterations, the total
+                reward after each of them and the Q table at the end of the
+                episode, or None if the log keeps no snapshots.
+        """
+        (chunks, q_offset) = self._episodes[i]
+        steps = [np.frombuffer(self._map, STEP, n, offset)
+                 for (offset, n) in chunks]
+        steps = steps[0] if len(steps) == 1 else \
+            np.concatenate(steps) if steps else np.zeros(0, STEP)
+        Q = np.frombuffer(self._map, "<f8", int(np.prod(self.shape)),
+                          q_offset).reshape(self.shape) if self.shape \
+            else None
+        return (steps["iteration"], steps["reward"], Q)
+
+    def episodes(self, start=0, stop=None, step=1):
+        """ Iterates over a range of episodes, see episode().
+        """
+        for i in range(*slice(start, stop, step).indices(len(self))):
+            yield self.episode(i)
+
+    def curve(self, points=1000):
+        """ Returns the learning curve, averaged over consecutive episodes
+        down to at most the given number of points.
+
+        Returns:
+            (np.ndarray, np.ndarray): The last episode of every point and the
+                                      mean total reward of its episodes.
+        """
+        n = len(self.totals)
+        if n <= points:
+            return (np.arange(n), self.totals)
+
+        bins = np.linspace(0, n, points + 1).astype(np.intp)
+        sums = np.add.reduceat(self.totals, bins[:-1])
+        return (bins[1:] - 1, sums / np.diff(bins))
@@ -0,0 +1,170 @@
+import multiprocessing
+import signal
+import sys
+import time
+import traceback
+
+import numpy as np
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+
+class ActorProcess(multiprocessing.Process):
+    """ Plays and learns episodes in its own emulator, with a Q table shared
+    by all the actors, until the trainer stops it or its deadline passes.
+
+    The table is read and updated without any locking. The episodes logged
+    by the agent are sent to the trainer, followed by None once the actor is
+    done, or by the exception which stopped it.
+    """
+
+    def __init__(self, index, make_agent, Q, shape, seed, stop, deadline,
+                 queue):
+        """
+        Args:
+            index (int): The index of the actor.
+            make_agent (callable): Builds the agent from a seed, e.g. QAgent.
+            Q (RawArray): The shared Q table.
+            shape (tuple): The shape of the Q table.
+            seed (int): The seed of the emulator and of np.random.
+            stop (Event): Stops the actor after its current episode.
+            deadline (float): The time after which no episode is started.
+            queue (Queue): The queue of the logged episodes.
+        """
+        super(ActorProcess, self).__init__()
+        self.daemon = True
+        self._index = index
+        self._make_agent = make_agent
+        self._Q = Q
+        self._shape = shape
+        self._seed = seed
+        self._stop = stop
+        self._deadline = deadline
+        self._queue = queue
+
+    def run(self):
+        # Interruptions are handled by the trainer, which stops the actors
+        # once their current episode is over
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            self.__act()
+            self._queue.put((self._index, None))
+        except Exception:
+            self._queue.put(
+                (self._index, RuntimeError(traceback.format_exc())))
+
+    def __act(self):
+        np.random.seed(self._seed)
+        agent = self._make_agent(seed=self._seed)
+        agent.Q = np.frombuffer(self._Q).reshape(self._shape)
+        # The reports of the actors would interleave, and all of them would
+        # be of their first episode. The trainer reports instead.
+        agent.report = lambda text: None
+
+        while not self._stop.is_set() and time.time() < self._deadline:
+            agent.run(True, episodes=1, headless=True)
+            for (iters, rewards, _) in agent.log:
+                self._queue.put((self._index, (iters, rewards)))
+            del agent.log[:]
+
+
+class HogwildTrainer(object):
+    """ Trains an agent with several actor processes which update a single
+    Q table in shared memory without locking (Hogwild).
+    """
+
+    def __init__(self, make_agent, Q, actors=None, seed=123):
+        """
+        Args:
+            make_agent (callable): Builds the agent of an actor from a seed,
+                                   e.g. QAgent. The agent learns into its Q
+                                   attribute and logs its episodes in its log
+                                   attribute, as QAgent does.
+            Q (np.ndarray): The initial Q table.
+            actors (int): The number of actors, one per core by default.
+            seed (int): The seed of the first actor, the others get the
+                        following ones.
+        """
+        self._make_agent = make_agent
+        self._actors = actors or multiprocessing.cpu_count()
+        self._seed = seed
+
+        self._shared_Q = multiprocessing.RawArray('d', int(Q.size))
+        self.Q = np.frombuffer(self._shared_Q).reshape(Q.shape)
+        self.Q[...] = Q
+        self.episodes = np.zeros(self._actors, np.int64)
+
+    def train(self, budget):
+        """ Runs the actors for a wall-clock budget. Ctrl-C stops them early.
+        Either way the actors finish their current episode.
+
+        Args:
+            budget (float): The number of seconds after which the actors
+                            stop starting new episodes.
+
+        Returns:
+            list: The merged log of the episodes, in the order they ended,
+                  in the format of QAgent.log. The Q tables are snapshots of
+                  the shared one when the episodes were received.
+        """
+        stop = multiprocessing.Event()
+        queue = multiprocessing.Queue()
+        deadline = time.time() + budget
+        actors = [ActorProcess(i, self._make_agent, self._shared_Q,
+                               self.Q.shape, self._seed + i, stop, deadline,
+                               queue)
+                  for i in range(self._actors)]
+        for actor in actors:
+            actor.start()
+
+        log = []
+        error = None
+        # The actors which are done, and the ones found dead without being
+        # done, e.g. killed or crashed in the emulator
+        done = set()
+        dead = set()
+        while len(done) < len(actors):
+            try:
+                (index, message) = queue.get(timeout=1.0)
+            except Empty:
+                # The last messages of a dead actor are in the queue by the
+                # next timeout, so it only failed if it is still not done
+                for (i, actor) in enumerate(actors):
+                    if i in dead and i not in done:
+                        done.add(i)
+                        error = error or RuntimeError(
+                            "actor {0} exited with code {1}".format(
+                                i, actor.exitcode))
+                        stop.set()
+                    elif not actor.is_alive():
+                        dead.add(i)
+                continue
+            except KeyboardInterrupt:
+                stop.set()
+                continue
+
+            if message is None:
+                done.add(index)
+            elif isinstance(message, Exception):
+                done.add(index)
+                error = error or message
+                stop.set()
+            else:
+                log.append(message + (np.copy(self.Q),))
+                self.episodes[index] += 1
+                self.report("actor {0}, episode {1}: {2}".format(
+                    index, self.episodes[index], message[1][-1]))
+
+        for actor in actors:
+            actor.join()
+        if error is not None:
+            raise error
+        return log
+
+    def report(self, text):
+        """ Prints the report of an episode an actor finished.
+        """
+        sys.stdout.write(text + "\n")
@@ -0,0 +1,180 @@
+import json
+import math
+import sys
+import timeit
+
+
+class Profiler(object):
+    """ Times the phases of Agent.run and counts the steps and frames.
+
+    Every phase keeps the number of calls, their total time and a histogram
+    of their latencies, where bin i counts the calls which took less than
+    2**i microseconds and at least half of that. The statistics of each
+    window of steps are handed to the reporters and then cleared.
+
+    Agent.run only calls the profiler when one is given, so the loop runs
+    untouched otherwise.
+    """
+
+    BINS = 24
+
+    def __init__(self, reporters=None, interval=10.0):
+        """
+        Args:
+            reporters (list): The reporters of the statistics, a
+                              StdoutReporter by default.
+            interval (float): The number of seconds between two reports.
+        """
+        self._reporters = [StdoutReporter()] if reporters is None \
+            else list(reporters)
+        self._interval = interval
+        self._clock = timeit.default_timer
+        self._phases = {}
+
+        self.steps = 0
+        self.frames = 0
+        self._last_frame = 0
+        self.__startWindow()
+
+    def __startWindow(self):
+        self._window_start = self._clock()
+        self._window_steps = 0
+        self._window_frames = 0
+        for phase in self._phases.values():
+            phase[0] = 0
+            phase[1] = 0.0
+            phase[2] = [0] * Profiler.BINS
+
+    def wrap(self, name, function):
+        """ Returns a function which calls the given one and times it as the
+        given phase.
+        """
+        phase = self._phases.setdefault(name, [0, 0.0, [0] * Profiler.BINS])
+        clock = self._clock
+        last = Profiler.BINS - 1
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            elapsed = clock() - start
+            phase[0] += 1
+            phase[1] += elapsed
+            phase[2][min(max(math.frexp(elapsed * 1e6)[1], 0), last)] += 1
+            return result
+
+        return timed
+
+    def step(self, frame):
+        """ Counts a step of the loop.
+
+        Args:
+            frame (int): The number of frames played since the last reset().
+        """
+        self._window_frames += frame - self._last_frame
+        self._last_frame = frame
+        self._window_steps += 1
+
+        # Only look at the clock every so often
+        if not self._window_steps % 100 and \
+                self._clock() - self._window_start >= self._interval:
+            self.flush()
+
+    def reset(self):
+        """ Restarts the frame count, e.g. on a new episode.
+        """
+        self._last_frame = 0
+
+    def flush(self):
+        """ Reports the statistics of the current window and starts a new
+        one.
+        """
+        if not self._window_steps:
+            return
+
+        stats = self.stats()
+        for reporter in self._reporters:
+            reporter.report(stats)
+        self.steps += self._window_steps
+        self.frames += self._window_frames
+        self.__startWindow()
+
+    def close(self):
+        self.flush()
+        for reporter in self._reporters:
+            reporter.close()
+
+    def stats(self):
+        """ Returns the statistics of the current window.
+
+        Returns:
+            dict: The steps and frames per second, the totals so far and, for
+                  every phase, the calls, their mean latency, the upper
+                  bounds of their median and 99th percentile latencies and
+                  their share of the window, all times in microseconds.
+        """
+        elapsed = max(self._clock() - self._window_start, 1e-9)
+        phases = {}
+        for (name, (calls, total, hist)) in self._phases.items():
+            if not calls:
+                continue
+            phases[name] = {
+                "calls": calls,
+                "mean_us": 1e6 * total / calls,
+                "p50_us": Profiler.__percentile(hist, 0.5),
+                "p99_us": Profiler.__percentile(hist, 0.99),
+                "share": total / elapsed,
+                "hist": hist}
+        return {
+            "steps": self.steps + self._window_steps,
+            "frames": self.frames + self._window_frames,
+            "seconds": elapsed,
+            "sps": self._window_steps / elapsed,
+            "fps": self._window_frames / elapsed,
+            "phases": phases}
+
+    @staticmethod
+    def __percentile(hist, q):
+        """ Returns the upper bound of the histogram bin of a percentile.
+        """
+        target = q * sum(hist)
+        count = 0
+        for (i, n) in enumerate(hist):
+            count += n
+            if count >= target:
+                return 2 ** i
+        return 2 ** (len(hist) - 1)
+
+
+class StdoutReporter(object):
+    """ Prints a line per report.
+    """
+
+    def __init__(self, stream=None):
+        self._stream = sys.stdout if stream is None else stream
+
+    def report(self, stats):
+        phases = " ".join(
+            "{0} {1:.0f}us ({2:.0%})".format(name, p["mean_us"], p["share"])
+            for (name, p) in sorted(stats["phases"].items()))
+        self._stream.write("{0} steps: {1:.1f} steps/s {2:.1f} frames/s | "
+                           "{3}\n".format(stats["steps"], stats["sps"],
+                                          stats["fps"], phases))
+        self._stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonLinesReporter(object):
+    """ Appends every report to a file as a line of JSON.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a")
+
+    def report(self, stats):
+        self._file.write(json.dumps(stats) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class ReplayMemory(object):
+    """ Keeps the last transitions of an agent in preallocated ring buffers,
+    so that they can be learned from again in random batches.
+
+    The states are flat state indices, e.g. the ones of QAgent.buildState(),
+    or rows of indices into the first axes of the Q table, and the actions
+    are indices into its last axis.
+    Adding a transition writes into the buffers in place, overwriting the
+    oldest one once the memory is full.
+    """
+
+    def __init__(self, capacity=100000, state_size=None):
+        """
+        Args:
+            capacity (int): The number of transitions kept.
+            state_size (int): The number of indices of a state, None for flat
+                              state indices.
+        """
+        shape = (capacity,) if state_size is None else (capacity, state_size)
+        self.capacity = capacity
+        self.states = np.zeros(shape, np.intp)
+        self.actions = np.zeros(capacity, np.intp)
+        self.rewards = np.zeros(capacity)
+        self.next_states = np.zeros(shape, np.intp)
+        self._position = 0
+        self._size = 0
+        # Arrays of the last sampled batch, see sample()
+        self._batch = None
+
+    def __len__(self):
+        return self._size
+
+    def add(self, state, action, reward, next_state):
+        """ Stores a transition.
+        """
+        i = self._position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self._position = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def addBatch(self, states, actions, rewards, next_states):
+        """ Stores a batch of transitions, e.g. one per emulator of a
+        VecAgent.
+        """
+        n = len(actions)
+        index = (self._position + np.arange(n)) % self.capacity
+        self.states[index] = states
+        self.actions[index] = actions
+        self.rewards[index] = rewards
+        self.next_states[index] = next_states
+        self._position = (self._position + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def sample(self, batch_size):
+        """ Draws a batch of the stored transitions uniformly, with
+        replacement.
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray, np.ndarray): The states,
+                actions, rewards and next states of the batch. They are
+                refilled by the next call with the same batch size.
+        """
+        if self._batch is None or len(self._batch[1]) != batch_size:
+            shape = (batch_size,) + self.states.shape[1:]
+            self._batch = (np.empty(shape, np.intp),
+                           np.empty(batch_size, np.intp),
+                           np.empty(batch_size),
+                           np.empty(shape, np.intp))
+        index = np.random.randint(0, self._size, batch_size)
+
+        (states, actions, rewards, next_states) = self._batch
+        np.take(self.states, index, axis=0, out=states)
+        np.take(self.actions, index, out=actions)
+        np.take(self.rewards, index, out=rewards)
+        np.take(self.next_states, index, axis=0, out=next_states)
+        return self._batch
+
+
+def batchUpdate(Q, states, actions, rewards, next_states, alpha, gamma):
+    """ Applies the Q-learning update of a batch of transitions at once.
+
+    All the targets are computed from the table before the batch. The
+    transitions which share a state-action pair are merged, see
+    mergeUpdates().
+
+    Args:
+        Q (np.ndarray): The Q table, indexed by the states then the actions,
+                        or a HashedQTable. It is updated in place.
+        states (np.ndarray): N flat state indices, or NxD indices of the
+                             first D axes of the table.
+        actions (np.ndarray): N action indices.
+        rewards (np.ndarray): N rewards.
+        next_states (np.ndarray): The next states, as the states.
+        alpha (float): The learning rate.
+        gamma (float): The discounting factor.
+    """
+    if not isinstance(Q, np.ndarray):
+        Q.update(states, actions, rewards, next_states, alpha, gamma)
+        return
+
+    (states, next_states) = (np.asarray(states), np.asarray(next_states))
+    if states.ndim == 1:
+        values = Q.reshape(-1, Q.shape[-1])
+        Q_next = np.max(values[next_states], axis=1)
+        pairs = np.ravel_multi_index((states, actions), values.shape)
+    else:
+        Q_next = np.max(Q[tuple(next_states.T)], axis=1)
+        pairs = np.ravel_multi_index(tuple(states.T) + (actions,), Q.shape)
+    mergeUpdates(Q, pairs, rewards + gamma * Q_next - Q.flat[pairs], alpha)
+
+
+def mergeUpdates(Q, pairs, errors, alpha):
+    """ Moves entries of a table by the learning rate times their errors.
+
+    The errors of the same entry are merged: it moves towards their mean as
+    far as that many updates with the same error would take it,
+    1 - (1 - alpha)**k of the way for k errors, so that a batch never
+    overshoots whatever its duplicates.
+
+    Args:
+        Q (np.ndarray): The table, updated in place.
+        pairs (np.ndarray): N flat indices of the entries.
+        errors (np.ndarray): N errors, e.g. TD errors.
+        alpha (float): The learning rate.
+    """
+    (pairs, inverse, counts) = np.unique(pairs, return_inverse=True,
+                                         return_counts=True)
+    errors = np.bincount(inverse.ravel(), errors, len(pairs)) / counts
+    Q.flat[pairs] += (1. - (1. - alpha) ** counts) * errors
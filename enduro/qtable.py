@@ -0,0 +1,183 @@
+import numpy as np
+
+from enduro.memory import mergeUpdates
+
+
+# The key of the empty slots of the index
+EMPTY = -1
+# Multiplier of the Fibonacci hashing of the keys
+GOLDEN = 0x9E3779B97F4A7C15
+
+
+class HashedQTable(object):
+    """ A Q table which only stores the states it has seen, for encoders
+    whose state space is too large for a dense table.
+
+    The values of the states are the rows of a contiguous array, in the
+    order the states were first seen. An open addressing index with linear
+    probing maps the state keys, non-negative integers, to their rows. It
+    is kept at most half full and both grow by doubling, so that lookups
+    take a couple of probes and only the memory of the seen states is used.
+
+    The states which have not been seen have the initial values, and are
+    only added by the functions which update the table.
+    """
+
+    def __init__(self, actions=4, initial=0., capacity=1024):
+        """
+        Args:
+            actions (int): The number of actions.
+            initial (float|list): The initial values of every action.
+            capacity (int): The number of states to make room for up front.
+        """
+        self.initial = np.zeros(actions)
+        self.initial[...] = initial
+        self.values = np.empty((capacity, actions))
+        self._row_keys = np.empty(capacity, np.int64)
+        self._size = 0
+        self.__allocateIndex(2 * capacity)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """ The number of bytes of the table's arrays.
+        """
+        return (self.values.nbytes + self._row_keys.nbytes +
+                self._keys.nbytes + self._rows.nbytes)
+
+    @property
+    def load(self):
+        """ The fraction of the slots of the index which are in use.
+        """
+        return self._size / float(len(self._keys))
+
+    def __allocateIndex(self, slots):
+        bits = max(int(np.ceil(np.log2(slots))), 1)
+        self._shift = 64 - bits
+        self._mask = (1 << bits) - 1
+        self._keys = np.empty(1 << bits, np.int64)
+        self._keys.fill(EMPTY)
+        self._rows = np.zeros(1 << bits, np.intp)
+
+    def __hash(self, keys):
+        return ((keys.astype(np.uint64) * np.uint64(GOLDEN)) >>
+                np.uint64(self._shift)).astype(np.intp)
+
+    def __find(self, keys):
+        """ Returns the slots of the keys, or the empty slots where their
+        probing ended.
+        """
+        slots = self.__hash(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            found = self._keys[slots[pending]]
+            pending = pending[np.logical_and(found != keys[pending],
+                                             found != EMPTY)]
+            slots[pending] = (slots[pending] + 1) & self._mask
+        return slots
+
+    def __place(self, keys, rows):
+        """ Adds keys which are not in the index yet.
+        """
+        slots = self.__hash(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            # Of the keys which probe the same empty slot, the first one
+            # takes it and the others move on
+            empty = pending[self._keys[slots[pending]] == EMPTY]
+            (_, first) = np.unique(slots[empty], return_index=True)
+            placed = empty[first]
+            self._keys[slots[placed]] = keys[placed]
+            self._rows[slots[placed]] = rows[placed]
+
+            taken = np.zeros(len(keys), np.bool_)
+            taken[placed] = True
+            pending = pending[np.logical_not(taken[pending])]
+            slots[pending] = (slots[pending] + 1) & self._mask
+
+    def __insert(self, keys):
+        """ Adds new states with the initial values.
+        """
+        (n, size) = (len(keys), self._size + len(keys))
+        if size > len(self.values):
+            capacity = len(self.values)
+            while capacity < size:
+                capacity *= 2
+            values = np.empty((capacity, self.values.shape[1]))
+            values[:self._size] = self.values[:self._size]
+            row_keys = np.empty(capacity, np.int64)
+            row_keys[:self._size] = self._row_keys[:self._size]
+            (self.values, self._row_keys) = (values, row_keys)
+
+        if 2 * size > len(self._keys):
+            self.__allocateIndex(2 * size)
+            self.__place(self._row_keys[:self._size],
+                         np.arange(self._size))
+
+        rows = np.arange(self._size, size)
+        self.values[rows] = self.initial
+        self._row_keys[rows] = keys
+        self.__place(keys, rows)
+        self._size = size
+
+    def rows(self, keys, insert=True):
+        """ Returns the rows of the values of some states.
+
+        Args:
+            keys (np.ndarray): The state keys.
+            insert (bool): Whether to add the states which are missing,
+                           rather than returning -1 for them.
+
+        Returns:
+            np.ndarray: The rows of the states in self.values.
+        """
+        keys = np.asarray(keys, np.int64)
+        slots = self.__find(keys)
+        found = self._keys[slots] == keys
+        rows = np.where(found, self._rows[slots], -1)
+        if insert and not np.all(found):
+            missing = np.logical_not(found)
+            self.__insert(np.unique(keys[missing]))
+            rows[missing] = self._rows[self.__find(keys[missing])]
+        return rows
+
+    def row(self, key):
+        """ Returns the values of a state, adding it if it is missing. The
+        row is a view of the table until the next states are added.
+        """
+        key = int(key)
+        slot = ((key * GOLDEN) & 0xFFFFFFFFFFFFFFFF) >> self._shift
+        while True:
+            found = self._keys[slot]
+            if found == key:
+                return self.values[self._rows[slot]]
+            if found == EMPTY:
+                self.__insert(np.asarray([key], np.int64))
+                return self.values[self._size - 1]
+            slot = (slot + 1) & self._mask
+
+    def get(self, keys):
+        """ Returns the values of some states, without adding them.
+        """
+        rows = self.rows(keys, insert=False)
+        values = self.values[np.maximum(rows, 0)]
+        values[rows < 0] = self.initial
+        return values
+
+    def max(self, keys):
+        return np.max(self.get(keys), axis=1)
+
+    def argmax(self, keys):
+        return np.argmax(self.get(keys), axis=1)
+
+    def update(self, keys, actions, rewards, next_keys, alpha, gamma):
+        """ Applies the Q-learning update of a batch of transitions, see
+        enduro.memory.batchUpdate().
+        """
+        Q_next = self.max(next_keys)
+        rows = self.rows(keys)
+        pairs = rows * self.values.shape[1] + np.asarray(actions)
+        mergeUpdates(self.values, pairs,
+                     rewards + gamma * Q_next - self.values.flat[pairs], alpha)
@@ -0,0 +1,292 @@
+import cv2
+import numpy as np
+
+from enduro.state import Frame, StateExtractor
+
+
+# The values of the tables for the keys which mean no opponent, and for the
+# keys which were never seen while fitting
+NONE = -1
+UNSEEN = -2
+
+
+class RamDecoder(object):
+    """ Decodes the environment grid from Enduro's 128 bytes of RAM.
+
+    The player's column and every opponent slot are decoded from a pair of
+    RAM bytes, through a table indexed by the 16 bit value of the pair. The
+    pairs and their tables are fitted on RAM snapshots labelled with the
+    grids of the vision pipeline, see fit().
+    """
+
+    def __init__(self, player, player_table, opponents, opponent_tables,
+                 shape=(11, 10)):
+        """
+        Args:
+            player (tuple): The pair of RAM addresses of the player's column.
+            player_table (np.ndarray): 65536 player columns, negative if
+                                       unknown.
+            opponents (np.ndarray): Kx2 RAM addresses of the opponent slots.
+            opponent_tables (np.ndarray): Kx65536 flat grid cells of the
+                                          opponents, NONE if there is none
+                                          and UNSEEN if unknown.
+            shape (tuple): The shape of the environment grid.
+        """
+        self.player = np.asarray(player, np.intp)
+        self.player_table = np.asarray(player_table, np.int16)
+        self.opponents = np.asarray(opponents, np.intp).reshape(-1, 2)
+        self.opponent_tables = np.asarray(
+            opponent_tables, np.int16).reshape(-1, 1 << 16)
+        self.shape = tuple(shape)
+
+    @staticmethod
+    def __keys(rams, pair):
+        return rams[..., pair[0]].astype(np.intp) << 8 | rams[..., pair[1]]
+
+    @staticmethod
+    def __majority(keys, labels):
+        """ Returns the keys, their most frequent label and its count.
+        """
+        (codes, counts) = np.unique(keys * 256 + labels, return_counts=True)
+        # The most frequent label of each key comes last
+        order = np.lexsort((counts, codes >> 8))
+        (codes, counts) = (codes[order], counts[order])
+        last = np.append((codes[1:] >> 8) != (codes[:-1] >> 8), True)
+        return (codes[last] >> 8, codes[last] & 0xFF, counts[last])
+
+    @classmethod
+    def __fitPlayer(cls, keys, columns):
+        (k, c, _) = cls.__majority(keys, columns)
+        table = np.empty(1 << 16, np.int16)
+        table.fill(UNSEEN)
+        table[k] = c
+        return table
+
+    @classmethod
+    def __fitOpponent(cls, keys, remaining, occupied):
+        """ Maps every key to the cell which holds an opponent in most of
+        the frames with that key, among the ones not explained yet.
+        """
+        (frames, cells) = np.nonzero(remaining)
+        (k, c, _) = cls.__majority(keys[frames], cells)
+
+        # Keep the cells which are right more often than not
+        (frames, cells) = np.nonzero(occupied)
+        (codes, hits) = np.unique(keys[frames] * 256 + cells,
+                                  return_counts=True)
+        hits = hits[np.searchsorted(codes, k * 256 + c)]
+        right = 2 * hits > np.bincount(keys, minlength=1 << 16)[k]
+
+        table = np.empty(1 << 16, np.int16)
+        table.fill(UNSEEN)
+        table[keys] = NONE
+        table[k[right]] = c[right]
+        return table
+
+    @staticmethod
+    def __gain(table, keys, remaining, occupied):
+        """ Returns the number of remaining opponents a slot explains minus
+        the number of opponents it makes up.
+        """
+        frames = np.nonzero(table[keys] >= 0)[0]
+        cells = table[keys[frames]]
+        return np.sum(remaining[frames, cells]) - \
+            np.sum(np.logical_not(occupied[frames, cells]))
+
+    @classmethod
+    def fit(cls, rams, grids, max_opponents=8, min_gain=None):
+        """ Fits a decoder on RAM snapshots and the matching grids of the
+        vision pipeline.
+
+        Candidate pairs of bytes are fitted on every other frame and scored
+        on the rest, so that tables which just memorise frames, e.g. through
+        a frame counter, are not picked.
+
+        Args:
+            rams (np.ndarray): Nx128 RAM snapshots.
+            grids (np.ndarray): Nx11x10 environment grids.
+            max_opponents (int): The maximum number of opponent slots.
+            min_gain (int): The number of extra opponents a slot must
+                            explain to be kept, 1% of the frames by default.
+
+        Returns:
+            RamDecoder: The fitted decoder.
+        """
+        rams = np.asarray(rams, np.uint8)
+        grids = np.asarray(grids)
+        (n, rows, cols) = grids.shape
+        if min_gain is None:
+            min_gain = max(1, n // 100)
+
+        (fit, test) = (slice(0, None, 2), slice(1, None, 2))
+
+        # Only bytes which change can carry any information. Single bytes
+        # come first so that they are preferred over pairs on ties.
+        varying = np.nonzero(np.any(rams != rams[:1], axis=0))[0]
+        pairs = [(a, a) for a in varying] + \
+            [(a, b) for i, a in enumerate(varying) for b in varying[i + 1:]]
+        keys = dict((pair, cls.__keys(rams, pair)) for pair in pairs)
+
+        # The player is always on the first row
+        columns = np.argmax(grids[:, 0, :] == 2, axis=1)
+        best = None
+        for pair in pairs:
+            table = cls.__fitPlayer(keys[pair][fit], columns[fit])
+            score = np.sum(table[keys[pair][test]] == columns[test])
+            if best is None or score > best[0]:
+                best = (score, pair)
+        player = best[1]
+        player_table = cls.__fitPlayer(keys[player], columns)
+
+        # Greedily add the slots which explain most of the remaining opponents
+        occupied = grids.reshape(n, -1) == 1
+        remaining = np.copy(occupied)
+        opponents = []
+        opponent_tables = []
+        while len(opponents) < max_opponents and np.any(remaining):
+            best = None
+            for pair in pairs:
+                table = cls.__fitOpponent(keys[pair][fit], remaining[fit],
+                                          occupied[fit])
+                gain = cls.__gain(table, keys[pair][test], remaining[test],
+                                  occupied[test])
+                if best is None or gain > best[0]:
+                    best = (gain, pair)
+            (gain, pair) = best
+            if gain < min_gain:
+                break
+
+            table = cls.__fitOpponent(keys[pair], remaining, occupied)
+            opponents.append(pair)
+            opponent_tables.append(table)
+
+            frames = np.nonzero(table[keys[pair]] >= 0)[0]
+            remaining[frames, table[keys[pair][frames]]] = False
+
+        return cls(player, player_table, opponents, opponent_tables,
+                   (rows, cols))
+
+    def decode(self, ram, out=None):
+        """ Builds the environment grid from a RAM snapshot.
+
+        Returns:
+            np.ndarray: The environment grid, or None if the player's column
+                        or any opponent slot cannot be decoded, i.e. its RAM
+                        bytes never took those values while fitting.
+        """
+        column = self.player_table[self.__keys(ram, self.player)]
+        cells = self.opponent_tables[
+            np.arange(len(self.opponents)),
+            ram[self.opponents[:, 0]].astype(np.intp) << 8 |
+            ram[self.opponents[:, 1]]]
+        if column < 0 or np.any(cells == UNSEEN):
+            return None
+
+        if out is None:
+            out = np.empty(self.shape, np.uint8)
+        out.fill(0)
+
+        # Colision ocurred
+        cells = cells[cells >= 0]
+        cells[cells == column] += self.shape[1]
+
+        grid = out.reshape(-1)
+        grid[cells[cells < grid.size]] = 1
+        grid[column] = 2
+        return out
+
+    def validate(self, rams, grids):
+        """ Compares the decoded grids with the ones of the vision pipeline.
+
+        Returns:
+            dict: The fraction of the frames which cannot be decoded, and the
+                  fraction of identical grids, of correct player columns and
+                  of the cells which agree, which the frames which cannot be
+                  decoded count against.
+        """
+        decoded = [self.decode(r) for r in rams]
+        unknown = np.asarray([d is None for d in decoded])
+        decoded = np.asarray([np.zeros(self.shape, np.uint8) if d is None
+                              else d for d in decoded])
+        grids = np.asarray(grids)
+        return {
+            "frames": len(grids),
+            "unknown": np.mean(unknown),
+            "grids": np.mean(np.all(decoded == grids, axis=(1, 2))),
+            "player": np.mean(np.all((decoded[:, 0] == 2) ==
+                                     (grids[:, 0] == 2), axis=1)),
+            "cells": np.mean(decoded == grids)}
+
+    def save(self, path):
+        np.savez_compressed(path, player=self.player,
+                            player_table=self.player_table,
+                            opponents=self.opponents,
+                            opponent_tables=self.opponent_tables,
+                            shape=self.shape)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["player"], data["player_table"], data["opponents"],
+                   data["opponent_tables"], data["shape"])
+
+
+class RamStateExtractor(object):
+    def __init__(self, ale, decoder="ram_decoder.npz", validate=False):
+        """ Builds the environment grid from the RAM instead of the screen.
+        The frames whose RAM cannot be decoded, see RamDecoder.decode(), are
+        extracted by the vision pipeline instead and counted in
+        self.unknown, out of self.frames.
+
+        Args:
+            ale (ALEInterface): The emulator to read the RAM from.
+            decoder (RamDecoder|str): The decoder or the file to load it
+                                      from, see calibrate_ram.py.
+            validate (bool): Whether to also run the vision pipeline on every
+                             frame and count the grids which differ.
+        """
+        self._ale = ale
+        if not isinstance(decoder, RamDecoder):
+            decoder = RamDecoder.load(decoder)
+        self._decoder = decoder
+        self._ram = np.empty(ale.getRAMSize(), np.uint8)
+
+        self._validate = validate
+        self._vision = StateExtractor(ale) if validate else None
+        self.frames = 0
+        self.unknown = 0
+        self.mismatches = 0
+
+    def run(self, draw=False, scale=1.0, image=True, lazy=False):
+        """ Returns the environment grid and the screen image without any
+        overlay, scaled only when drawing, or its Frame when lazy. The grid is
+        a new array on every frame, so that it can be kept, e.g. by a
+        RenderSink.
+        """
+        grid = self._decoder.decode(self._ale.getRAM(self._ram))
+        self.frames += 1
+
+        if grid is None:
+            self.unknown += 1
+            if self._vision is None:
+                self._vision = StateExtractor(self._ale)
+            return self._vision.run(draw, scale, image, lazy)
+
+        if self._validate:
+            (expected, frame) = self._vision.run(draw, scale, image, lazy)
+            self.mismatches += not np.array_equal(grid, expected)
+            return (grid, frame)
+
+        if not image:
+            return (grid, None)
+
+        frame = Frame(RamStateExtractor.__render, self._ale.getScreenRGB(),
+                      draw, scale)
+        return (grid, frame if lazy else frame.image())
+
+    @staticmethod
+    def __render(screen, draw, scale):
+        image = cv2.cvtColor(screen, cv2.COLOR_RGB2BGR)
+        if not draw:
+            return image
+        return cv2.resize(image, None, fx=scale, fy=scale)
@@ -0,0 +1,206 @@
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+from enduro.palette import rgbToPalette
+
+
+# The file starts with the magic number, the version and the screen
+# height and width. Each chunk then starts with its number of frames, whether
+# its screens are compressed and their size in the file. The records of the
+# frames follow, then their screens.
+MAGIC = b"EREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sIII")
+CHUNK_HEADER = struct.Struct("<IIQ")
+RECORD = np.dtype([("action", "<i4"), ("reward", "<i4"), ("frame", "<i8")])
+
+# The actions of the records which do not follow an act() call
+START = -1
+RESET = -2
+
+
+class Recorder(object):
+    """ Records the screens an emulator goes through, along with the
+    actions, rewards and frame numbers which led to them.
+
+    The recorder stands in for the emulator and forwards everything to it.
+    A record is written after every act() and reset_game() call, and the
+    current chunk is written to the file on every reset_game(), so that all
+    the finished episodes are on disk.
+    """
+
+    def __init__(self, ale, path, chunk_frames=256, compress=True):
+        """
+        Args:
+            ale (ALEInterface): The emulator to record.
+            path (str): The file to record to.
+            chunk_frames (int): The maximum number of frames of a chunk.
+            compress (bool): Whether to compress the chunks with zlib, which
+                             keeps them from being memory mapped on replay.
+        """
+        self._ale = ale
+        self._compress = compress
+        [w, h] = ale.getScreenDims()
+        self._records = np.zeros(chunk_frames, RECORD)
+        self._screens = np.zeros((chunk_frames, h, w, 3), np.uint8)
+        self._size = 0
+
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, h, w))
+        self.__record(START, 0)
+
+    def __getattr__(self, name):
+        return getattr(self._ale, name)
+
+    def __record(self, action, reward):
+        record = self._records[self._size]
+        record["action"] = action
+        record["reward"] = reward
+        record["frame"] = self._ale.getFrameNumber()
+        self._ale.getScreenRGB(self._screens[self._size])
+
+        self._size += 1
+        if self._size == len(self._records):
+            self.flush()
+
+    def act(self, action):
+        reward = self._ale.act(action)
+        self.__record(action, reward)
+        return reward
+
+    def reset_game(self):
+        self._ale.reset_game()
+        self.__record(RESET, 0)
+        self.flush()
+
+    def flush(self):
+        """ Writes the frames recorded since the last chunk as a new chunk.
+        """
+        if not self._size:
+            return
+
+        screens = self._screens[:self._size].tobytes()
+        if self._compress:
+            screens = zlib.compress(screens, 1)
+        self._file.write(CHUNK_HEADER.pack(self._size, self._compress,
+                                           len(screens)))
+        self._file.write(self._records[:self._size].tobytes())
+        self._file.write(screens)
+        self._file.flush()
+        self._size = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class ReplayALE(object):
+    """ Replays a recording in place of the emulator, with the subset of the
+    ALEInterface which Agent, Controller and the screen based extractors
+    use. Palette screens are converted back from the recorded RGB ones.
+
+    Each act() call moves to the next recorded frame and returns its reward,
+    whatever the action, and reset_game() skips to the start of the next
+    recorded episode. The screens of uncompressed recordings are read-only
+    views of the memory mapped file.
+    """
+
+    def __init__(self, path, loop=False):
+        """
+        Args:
+            path (str): The recording.
+            loop (bool): Whether to start over at the end of the recording,
+                         rather than raising EOFError.
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, h, w) = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} is not a recording".format(path))
+        self._shape = (h, w, 3)
+        self._loop = loop
+
+        # Read the records of all the chunks but leave the screens in place.
+        # A chunk cut short, e.g. by a crash, ends the recording.
+        self._chunks = []
+        records = []
+        offset = FILE_HEADER.size
+        while offset + CHUNK_HEADER.size <= len(self._map):
+            (n, compressed, size) = CHUNK_HEADER.unpack_from(self._map, offset)
+            offset += CHUNK_HEADER.size + n * RECORD.itemsize
+            if offset + size > len(self._map):
+                break
+            records.append(np.frombuffer(self._map, RECORD, n,
+                                         offset - n * RECORD.itemsize))
+            self._chunks.append((offset, n, compressed, size))
+            offset += size
+
+        self._records = np.concatenate(records) if records \
+            else np.zeros(0, RECORD)
+        if not len(self._records):
+            raise ValueError("{0} has no frames".format(path))
+        self._starts = np.cumsum([0] + [c[1] for c in self._chunks])
+        self._resets = np.nonzero(self._records["action"] == RESET)[0]
+        self._cached = (None, None)
+        self._index = 0
+        self._frame_offset = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __chunkScreens(self, chunk):
+        (offset, n, compressed, size) = self._chunks[chunk]
+        if compressed:
+            (data, offset) = (zlib.decompress(self._map[offset:offset + size]),
+                              0)
+        else:
+            data = self._map
+        screens = np.frombuffer(data, np.uint8, n * int(np.prod(self._shape)),
+                                offset)
+        return screens.reshape((n,) + self._shape)
+
+    def __screen(self, index):
+        """ Returns a screen, keeping the screens of its chunk at hand for
+        the next ones.
+        """
+        chunk = np.searchsorted(self._starts, index, side="right") - 1
+        if self._cached[0] != chunk:
+            self._cached = (chunk, self.__chunkScreens(chunk))
+        return self._cached[1][index - self._starts[chunk]]
+
+    def __seek(self, index):
+        if index >= len(self._records):
+            if not self._loop:
+                raise EOFError("the end of the recording was reached")
+            # Keep the frame numbers increasing
+            index = 0
+            frames = self._records["frame"]
+            self._frame_offset += int(frames[-1] - frames[0])
+        self._index = index
+
+    def getScreenDims(self):
+        return (self._shape[1], self._shape[0])
+
+    def getScreenRGB(self, screen_data=None):
+        screen = self.__screen(self._index)
+        if screen_data is None:
+            return screen
+        np.copyto(screen_data, screen)
+        return screen_data
+
+    def getScreen(self, screen_data=None):
+        return rgbToPalette(self.__screen(self._index), screen_data)
+
+    def getFrameNumber(self):
+        return int(self._records[self._index]["frame"]) + self._frame_offset
+
+    def act(self, action):
+        self.__seek(self._index + 1)
+        return int(self._records[self._index]["reward"])
+
+    def reset_game(self):
+        resets = self._resets[self._resets > self._index]
+        self.__seek(resets[0] if len(resets) else len(self._records))
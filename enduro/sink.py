@@ -0,0 +1,197 @@
+import collections
+import os
+import sys
+import threading
+
+import cv2
+
+from enduro.state import EnvironmentState, Frame
+
+
+# OpenCV 2 keeps the codec codes in its cv module
+FOURCC = getattr(cv2, "VideoWriter_fourcc", None)
+if FOURCC is None:
+    FOURCC = cv2.cv.CV_FOURCC
+
+
+class RenderSink(object):
+    """ Hands the rendered steps and the reports of the training loop over
+    to outputs which run on a background thread.
+
+    Submitting never blocks: the rendered steps wait in a bounded queue and
+    the oldest one is dropped when it is full, so a slow display only loses
+    frames. The reports wait in a queue of their own and are never dropped.
+    The steps hold references to the grids and images, which must not be
+    modified afterwards, e.g. by a preallocating extractor. Frames are
+    turned into images on the background thread, and only if no newer step
+    has pushed them out first.
+    """
+
+    def __init__(self, outputs, maxlen=8):
+        """
+        Args:
+            outputs (list): The outputs of the items, e.g. WindowOutput,
+                            ConsoleOutput, VideoOutput or
+                            ImageSequenceOutput.
+            maxlen (int): The number of rendered steps which may wait.
+        """
+        self._outputs = list(outputs)
+        self._items = collections.deque(maxlen=maxlen)
+        self._reports = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self.__loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, episode, iteration, grid=None, image=None, text=None):
+        """ Queues a step for the outputs.
+
+        Args:
+            episode (int): The number of the episode.
+            iteration (int): The number of the iteration.
+            grid (np.ndarray): The environment grid, if any.
+            image (np.ndarray|Frame): The frame, if any.
+            text (str): A report, if any.
+        """
+        with self._condition:
+            if text is not None:
+                self._reports.append((episode, iteration, None, None, text))
+            if grid is not None or image is not None:
+                if len(self._items) == self._items.maxlen:
+                    self.dropped += 1
+                self._items.append((episode, iteration, grid, image, None))
+            self._condition.notify()
+
+    def __loop(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._reports and \
+                        not self._closed:
+                    self._condition.wait()
+                # Reports go first, since they are small and never dropped
+                items = self._reports or self._items
+                if not items:
+                    break
+                (episode, iteration, grid, image, text) = items.popleft()
+
+            if isinstance(image, Frame):
+                image = image.image()
+            item = (episode, iteration, grid, image, text)
+            for output in self._outputs:
+                output.write(*item)
+
+    def close(self):
+        """ Waits for the queued items to be written and closes the outputs.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        for output in self._outputs:
+            output.close()
+
+
+class WindowOutput(object):
+    """ Shows the grids and the frames in windows. Needs a platform where
+    windows can be updated from any thread, e.g. Linux.
+    """
+
+    def write(self, episode, iteration, grid, image, text):
+        if grid is not None:
+            cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
+        if image is not None:
+            cv2.imshow("Enduro", image)
+        cv2.waitKey(1)
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class ConsoleOutput(object):
+    """ Prints the reports.
+    """
+
+    def write(self, episode, iteration, grid, image, text):
+        if text is not None:
+            sys.stdout.write(text + "\n")
+            sys.stdout.flush()
+
+    def close(self):
+        pass
+
+
+class VideoOutput(object):
+    """ Writes the frames of the selected episodes to a video per episode.
+    """
+
+    def __init__(self, path="episode_{0}.mp4", fps=30, episodes=None,
+                 fourcc="mp4v"):
+        """
+        Args:
+            path (str): The path of the videos, formatted with the episode.
+            fps (float): The frame rate of the videos.
+            episodes (list): The episodes to write, all of them if None.
+            fourcc (str): The codec of the videos.
+        """
+        self._path = path
+        self._fps = fps
+        self._episodes = None if episodes is None else set(episodes)
+        self._fourcc = FOURCC(*fourcc)
+        self._writer = None
+        self._episode = None
+
+    def write(self, episode, iteration, grid, image, text):
+        if image is None and grid is not None:
+            image = EnvironmentState.draw(grid)
+        if image is None or \
+                (self._episodes is not None and episode not in self._episodes):
+            return
+
+        if episode != self._episode:
+            self.close()
+            (h, w) = image.shape[:2]
+            self._writer = cv2.VideoWriter(self._path.format(episode),
+                                           self._fourcc, self._fps, (w, h))
+            self._episode = episode
+        self._writer.write(image)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+            self._episode = None
+
+
+class ImageSequenceOutput(object):
+    """ Writes the frames of the selected episodes to numbered images.
+    """
+
+    def __init__(self, directory, episodes=None, extension="png"):
+        """
+        Args:
+            directory (str): The directory of the images.
+            episodes (list): The episodes to write, all of them if None.
+            extension (str): The image format.
+        """
+        self._directory = directory
+        self._episodes = None if episodes is None else set(episodes)
+        self._extension = extension
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, episode, iteration, grid, image, text):
+        if image is None and grid is not None:
+            image = EnvironmentState.draw(grid)
+        if image is None or \
+                (self._episodes is not None and episode not in self._episodes):
+            return
+
+        cv2.imwrite(os.path.join(
+            self._directory, "{0:04d}_{1:05d}.{2}".format(
+                episode, iteration, self._extension)), image)
+
+    def close(self):
+        pass
@@ -1,206 +1,534 @@
-import copy
+import zlib
+
 import cv2
 import numpy as np
 
+from collections import OrderedDict
 
-class EnvironmentState:
-    @staticmethod
-    def draw(grid, sz=40):
-        [h, w] = grid.shape
-        image = np.ones((h * sz, w * sz, 3), np.uint8)
-        for i in range(h):
-            for j in range(w):
-                if grid[i][j] == 2:
-                    cv2.rectangle(image,
-                                  (j * sz, i * sz),
-                                  ((j + 1) * sz, (i + 1) * sz),
-                                  (0x0F, 0x70, 0x50),
-                                  -1)
-                elif grid[i][j] == 1:
-                    cv2.rectangle(image,
-                                  (j * sz, i * sz),
-                                  ((j + 1) * sz, (i + 1) * sz),
-                                  (0x43, 0x04, 0xAE),
-                                  -1)
-        for i in range(h):
-            cv2.line(image,
-                     (0, i * sz),
-                     (image.shape[1], i * sz),
-                     (0xE8, 0xE8, 0xE8), 1)
 
-        for i in range(w):
-            cv2.line(image,
-                     (i * sz, 0),
-                     (i * sz, image.shape[0]),
-                     (0xE8, 0xE8, 0xE8), 1)
+# OpenCV 2 keeps some constants in its cv module, and has no connected
+# components, see StateExtractor.__labelCars()
+REDUCE_SUM = getattr(cv2, "REDUCE_SUM", None)
+if REDUCE_SUM is None:
+    REDUCE_SUM = cv2.cv.CV_REDUCE_SUM
 
-        return cv2.flip(image, 0)
 
+class EnvironmentState:
+    # Colors of the free cells, the opponents and the player, and of the
+    # grid lines
+    COLORS = np.asarray([(1, 1, 1), (0x43, 0x04, 0xAE), (0x0F, 0x70, 0x50)],
+                        np.uint8)
+    LINE = (0xE8, 0xE8, 0xE8)
 
-class StateExtractor:
-    def __init__(self, ale):
-        self._ale = ale
-        self._is_cv3 = cv2.__version__.startswith("3.")
-
-    def run(self, draw=False, scale=1.0):
-        image = self.__getScreenImage()
-        # Use an image copy for processing
-        img = self.__removeOffroadRegions(np.copy(image))
-        self._road_grid = self.__detectRoadGrid(img)
-        self._cars = self.__detectCars(
-            img * self.__getRoadMask(img, self._road_grid))
+    @staticmethod
+    def draw(grid, sz=40, out=None):
+        """ Draws an environment grid, the player's row at the bottom.
 
-        self._state_grid = self.__getStateGrid(self._road_grid, self._cars)
+        Args:
+            grid (np.ndarray): The environment grid.
+            sz (int): The size of a cell in pixels.
+            out (np.ndarray): The image to draw into, if any.
 
-        if draw:
-            self.__draw(image, scale)
+        Returns:
+            np.ndarray: The BGR image of the grid.
+        """
+        return EnvironmentState.drawBatch(np.asarray(grid)[None], sz, 1, out)
 
-        return (self._state_grid, image)
+    @staticmethod
+    def drawBatch(grids, sz=40, cols=None, out=None):
+        """ Draws a stack of environment grids as the tiles of a mosaic, left
+        to right and top to bottom. The tiles left over are black.
+
+        Args:
+            grids (np.ndarray): NxHxW environment grids.
+            sz (int): The size of a cell in pixels.
+            cols (int): The number of tiles per row, enough for a square
+                        mosaic by default.
+            out (np.ndarray): The image to draw into, if any.
+
+        Returns:
+            np.ndarray: The BGR image of the mosaic.
+        """
+        grids = np.asarray(grids)
+        (n, h, w) = grids.shape
+        cols = cols or int(np.ceil(np.sqrt(n)))
+        rows = (n + cols - 1) // cols
+        if out is None:
+            out = np.empty((rows * h * sz, cols * w * sz, 3), np.uint8)
+        tiles = out.reshape(rows, h, sz, cols, w, sz, 3)
+
+        # Upscale the colors of the cells along the rows of the mosaic, then
+        # copy each row of cells down its height, upside down
+        index = np.zeros((rows * cols, h, w), np.intp)
+        index[:n] = np.where(np.logical_or(grids == 1, grids == 2), grids, 0)
+        colors = EnvironmentState.COLORS[index[:, ::-1]]
+        colors = colors.reshape(rows, cols, h, w, 3).transpose(0, 2, 1, 3, 4)
+        strip = np.repeat(colors.reshape(rows * h, cols * w, 3), sz, axis=1)
+        out.reshape(rows * h, sz, -1)[...] = strip.reshape(rows * h, 1, -1)
+
+        # Lines along the bottom and left sides of the cells
+        tiles[:, :, -1] = EnvironmentState.LINE
+        tiles[:, :, :, :, :, 0] = EnvironmentState.LINE
+
+        for tile in range(n, rows * cols):
+            tiles[tile // cols, :, :, tile % cols] = 0
+
+        return out
+
+
+class Frame(object):
+    """ The image of a frame, which is only built when it is first asked for
+    and then kept, so that frames which are never looked at cost nothing.
+    """
+
+    def __init__(self, build, *args):
+        """
+        Args:
+            build (callable): Builds the image from the given arguments.
+        """
+        self._build = build
+        self._args = args
+        self._image = None
+
+    def image(self):
+        """ Returns the BGR image of the frame, building it on the first call.
+        """
+        if self._image is None:
+            self._image = self._build(*self._args)
+            (self._build, self._args) = (None, None)
+        return self._image
 
-    def __getScreenImage(self):
-        [w, h] = self._ale.getScreenDims()
-        image = cv2.cvtColor(self._ale.getScreenRGB(), cv2.COLOR_RGB2BGR)
-        image = cv2.resize(image, (h, w), interpolation=cv2.INTER_NEAREST)
-        return image
 
-    def __removeOffroadRegions(self, image):
+class StateExtractor:
+    # Relative heights of the horizon lines, from the farthest to the closest
+    HORIZON = np.asarray([0.33, 0.34, 0.36, 0.38, 0.4, 0.43,
+                          0.46, 0.49, 0.53, 0.57, 0.63, 0.7])
+    # Relative positions of the cell boundaries along each horizon line
+    LANES = np.asarray([0.01 * x for x in range(0, 101, 10)])
+
+    def __init__(self, ale, preallocate=False, road_cache=8, road_tolerance=0,
+                 cache_size=0):
+        """ Extracts the environment grid from the emulator screen.
+
+        Args:
+            ale (ALEInterface): The emulator to read the screen from.
+            preallocate (bool): Whether to keep the frame sized arrays of the
+                                pipeline and fill them in place on the next
+                                frames. The returned image is then only
+                                valid until the next call to run(), and
+                                the image of a Frame until the next Frame
+                                builds its own.
+            road_cache (int): The number of road grids whose road mask and
+                              cell map are kept, least recently used first
+                              out.
+            road_tolerance (int): How far, in pixels, the road grid may move
+                                  and still reuse the road mask of a cached
+                                  one. Cell maps always need the same grid.
+            cache_size (int): The number of screens whose results are kept,
+                              least recently used first out, so that
+                              identical screens are only processed once.
+                              0 disables the cache.
+        """
+        self._ale = ale
+        # Road masks and cell index images of the last road grids, see
+        # __getRoadMask() and __getCellMap()
+        self._road_cache = road_cache
+        self._road_tolerance = road_tolerance
+        self._road_masks = OrderedDict()
+        self._cell_maps = OrderedDict()
+        # Results of the last screens and how often they were reused, see
+        # __lookupScreen()
+        self._cache_size = cache_size
+        self._screens = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Scratch arrays of the pipeline, see _buffer()
+        self._preallocate = preallocate
+        self._buffers = {}
+        # Number of frame sized arrays allocated so far
+        self.allocations = 0
+
+    def run(self, draw=False, scale=1.0, image=True, lazy=False):
+        """ Extracts the environment grid from the current screen.
+
+        Args:
+            draw (bool): Whether to overlay the road grid and the cars on
+                         the returned image.
+            scale (float): The scale of the returned image when drawing.
+            image (bool): Whether to return the screen image at all.
+            lazy (bool): Whether to return a Frame which only converts,
+                         scales and annotates the image when it is asked for,
+                         instead of the image itself.
+
+        Returns:
+            (np.ndarray, np.ndarray): The 11x10 environment grid and the BGR
+                                      screen image or its Frame, or None.
+        """
+        screen = self._getScreenImage()
+        if self._cache_size <= 0 or not self.__lookupScreen(screen):
+            (road, player, others) = self._classifyPixels(screen)
+            self._road_grid = self.__detectRoadGrid(road)
+            self._cars = self.__detectCars(
+                player, others, self.__getRoadMask(road, self._road_grid))
+
+            self._state_grid = self.__getStateGrid(
+                self._road_grid, self._cars, road.shape)
+
+            if self._cache_size > 0:
+                self.__storeScreen(screen)
+
+        if not image:
+            return (self._state_grid, None)
+
+        if lazy and self._preallocate:
+            # The screen buffer is refilled by the next frame
+            copy = self._allocate(screen.shape)
+            np.copyto(copy, screen)
+            screen = copy
+        frame = Frame(self.__render, screen, self._road_grid, self._cars,
+                      draw, scale)
+        return (self._state_grid, frame if lazy else frame.image())
+
+    def __lookupScreen(self, screen):
+        """ Restores the results of an identical screen, if one is cached.
+
+        Returns:
+            bool: Whether the screen was found.
+        """
+        # The checksum and the comparison read the screen in place
+        self._screen_key = zlib.crc32(screen)
+        cached = self._screens.pop(self._screen_key, None)
+        # Screens which only share their checksum are told apart here
+        if cached is None or cv2.norm(cached[0], screen, cv2.NORM_INF) > 0:
+            self.cache_misses += 1
+            return False
+
+        self._screens[self._screen_key] = cached
+        (_, grid, self._road_grid, self._cars) = cached
+        self._state_grid = np.copy(grid)
+        self.cache_hits += 1
+        return True
+
+    def __storeScreen(self, screen):
+        # Once the cache is full, the screen of the least recently used
+        # entry is overwritten instead of copying into a new array
+        copy = None
+        if len(self._screens) >= self._cache_size:
+            (_, (copy, _, _, _)) = self._screens.popitem(last=False)
+        if copy is None or copy.shape != screen.shape:
+            copy = self._allocate(screen.shape)
+        np.copyto(copy, screen)
+        self._screens[self._screen_key] = (
+            copy, np.copy(self._state_grid), self._road_grid, self._cars)
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """ Returns an uninitialised frame sized array for a pipeline stage,
+        which is reused across frames when preallocating.
+        """
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self._allocate(shape, dtype)
+            if self._preallocate:
+                self._buffers[name] = buf
+        return buf
+
+    def _allocate(self, shape, dtype=np.uint8):
+        """ Returns a new frame sized array. Every one of them goes through
+        here, so that self.allocations counts them all.
+        """
+        self.allocations += 1
+        return np.empty(shape, dtype)
+
+    def _getOffroadPixel(self, screen):
         # This pixel always has the color of the background
-        offroad_pt = (int(0.99 * image.shape[1]), int(0.5 * image.shape[0]))
-        offroad_color = image[offroad_pt[1], offroad_pt[0], :]
-        mask = np.logical_or(
-            np.logical_or(image[:, :, 0] != offroad_color[0],
-                          image[:, :, 1] != offroad_color[1]),
-            image[:, :, 2] != offroad_color[2])
-        return image * mask.reshape(image.shape[0], image.shape[1], -1)
-
-    def __intersectRoad(self, image, hline):
-        img = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        nonzeros = np.nonzero(img[hline, :])[0]
-
-        # Make sure to hande aliasing effects
-        if len(nonzeros) < 2:
-            return self.__intersectRoad(image, hline + 1)
-
-        return (nonzeros[0], nonzeros[-1])
-
-    def __detectRoadGrid(self, image):
-        grid = []
-
-        hs = [0.33, 0.34, 0.36, 0.38, 0.4, 0.43,
-              0.46, 0.49, 0.53, 0.57, 0.63, 0.7]
-
-        for rel_h in hs:
-            line = []
-            y = int(rel_h * image.shape[0])
-            [l, r] = self.__intersectRoad(image, y)
-            for rel_w in [0.01 * x for x in range(0, 101, 10)]:
-                x = int((1 - rel_w) * l + rel_w * r)
-                line.append([x, y])
-            grid.append(line)
+        return screen[int(0.5 * screen.shape[0]), int(0.99 * screen.shape[1])]
+
+    def _getScreenImage(self):
+        """ Reads the screen which the pixels are classified on.
+        """
+        [w, h] = self._ale.getScreenDims()
+        rgb = self._ale.getScreenRGB(self._buffer("rgb", (h, w, 3)))
+        return cv2.resize(rgb, (h, w),
+                          dst=self._buffer("screen", (w, h, 3)),
+                          interpolation=cv2.INTER_NEAREST)
+
+    def _getImage(self, screen):
+        """ Converts the screen to a BGR image.
+        """
+        return cv2.cvtColor(screen, cv2.COLOR_RGB2BGR,
+                            dst=self._buffer("image", screen.shape))
+
+    def _classifyPixels(self, image):
+        """ Returns 0/1 masks of the road edges, player's car and opponents'
+        cars pixels, not yet restricted to the road.
+        """
+        shape = image.shape[:2]
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY,
+                            dst=self._buffer("gray", shape))
+
+        # Remove the offroad regions
+        color = self._getOffroadPixel(image)
+        onroad = cv2.inRange(image, color, color,
+                             dst=self._buffer("onroad", shape))
+        cv2.bitwise_not(onroad, dst=onroad)
+
+        # The player's car is the only bright object on the road
+        bright = cv2.inRange(image, (181, 181, 181), (255, 255, 255),
+                             dst=self._buffer("bright", shape))
+        cv2.bitwise_and(bright, onroad, dst=bright)
+
+        def threshold(t, mask, name):
+            _, out = cv2.threshold(gray, t, 1, cv2.THRESH_BINARY,
+                                   dst=self._buffer(name, shape))
+            return cv2.bitwise_and(out, mask, dst=out)
+
+        road = threshold(0, onroad, "road")
+        player = threshold(170, bright, "player")
+        others = threshold(80, cv2.bitwise_xor(onroad, bright, dst=bright),
+                           "others")
+        return (road, player, others)
+
+    def __searchRoadEdges(self, road, ys):
+        # Make sure to hande aliasing effects by using the first row below
+        # each horizon line which has at least two road pixels
+        top = ys[0]
+        counts = cv2.reduce(road[top:].view(np.uint8), 1, REDUCE_SUM,
+                            dtype=cv2.CV_32S)
+        valid = counts.ravel() >= 2
+        rows = np.where(valid, np.arange(top, road.shape[0]), road.shape[0])
+        rows = np.minimum.accumulate(rows[::-1])[::-1][ys - top]
+
+        lines = road[rows]
+        left = np.argmax(lines, axis=1)
+        right = road.shape[1] - 1 - np.argmax(lines[:, ::-1], axis=1)
+        return (rows, left, right)
+
+    def __detectRoadGrid(self, road):
+        # Road edges are the first and last road pixels of the horizon lines
+        road = road.view(np.bool_)
+        ys = (self.HORIZON * road.shape[0]).astype(np.int32)
+
+        (_, left, right) = self.__searchRoadEdges(road, ys)
+        grid = np.empty((len(ys), len(self.LANES), 2), np.int32)
+        grid[:, :, 0] = (1 - self.LANES) * left[:, None] + \
+            self.LANES * right[:, None]
+        grid[:, :, 1] = ys[:, None]
         return grid
 
+    def __cached(self, cache, key, name, shape, dtype, build, *args):
+        """ Returns the array of a key of an LRU cache, built with
+        build(out, *args) into an array of the given shape if the key is
+        missing. Once the cache is full, the array of the least recently
+        used key is built into instead of a new one.
+        """
+        value = cache.pop(key, None)
+        if value is None:
+            if self._road_cache <= 0:
+                out = self._buffer(name, shape, dtype)
+            elif len(cache) >= self._road_cache:
+                (_, out) = cache.popitem(last=False)
+            else:
+                out = None
+            if out is None or out.shape != shape or out.dtype != dtype:
+                out = self._allocate(shape, dtype)
+            value = build(out, *args)
+        if self._road_cache > 0:
+            cache[key] = value
+            if len(cache) > self._road_cache:
+                cache.popitem(last=False)
+        return value
+
     def __getRoadMask(self, image, grid):
-        g = copy.deepcopy(grid)
+        # Grids within the tolerance of each other share their mask
+        t = self._road_tolerance
+        key = (image.shape, ((grid[:, :, 0] + t // 2) // (t + 1)).tobytes())
+        return self.__cached(self._road_masks, key, "mask", image.shape[:2],
+                             np.uint8, self.__buildRoadMask, grid)
+
+    def __buildRoadMask(self, mask, grid):
+        g = np.copy(grid)
         # Shring grid to avoid noise on the road edges
-        for i in range(len(g)):
-            g[i][0][0] += max(5, i)
-            g[i][-1][0] -= max(5, i)
-
-        # Make a polygon from the grid
-        pts = []
-        # Top
-        for i in range(len(g[0])):
-            pts.append(g[0][i])
-        # Right
-        for i in range(len(g)):
-            pts.append(g[i][-1])
-        # Bottom
-        for i in reversed(range(len(g[-1]))):
-            pts.append(g[-1][i])
-        # Left
-        for i in reversed(range(len(g))):
-            pts.append(g[i][0])
-
-        mask = np.zeros((image.shape[0], image.shape[1]), np.uint8)
-        cv2.fillPoly(mask, np.asarray([pts]), (1))
-        mask = mask.reshape(mask.shape[0], mask.shape[1], -1)
+        shrink = np.maximum(5, np.arange(len(g)))
+        g[:, 0, 0] += shrink
+        g[:, -1, 0] -= shrink
 
-        return mask
-
-    def __detectCars(self, image):
-        res = {}
+        # Make a polygon from the grid: top, right, bottom and left sides
+        pts = np.concatenate([g[0], g[:, -1], g[-1, ::-1], g[::-1, 0]])
 
-        # Find player's car pixels
-        mask = np.logical_and(
-            np.logical_and(image[:, :, 0] > 180,
-                           image[:, :, 1] > 180),
-            image[:, :, 2] > 180).reshape(image.shape[0], image.shape[1], -1)
+        mask.fill(0)
+        cv2.fillPoly(mask, [pts], (1))
 
-        # Detect the contour of the player's car
-        _, thresh = cv2.threshold(
-            cv2.cvtColor(image * mask, cv2.COLOR_BGR2GRAY), 170, 255, 0)
+        return mask
 
-        if self._is_cv3:
-            _, contours, hierarchy = cv2.findContours(
-                thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    def __detectCars(self, player, others, mask):
+        """ Labels the cars of both masks at once, with the player's mask on
+        the left of the opponents' one and a blank column in between.
+
+        Returns:
+            dict: The bounding box (x, y, w, h) and the centroid of the
+                  largest car of the player's mask, as "self" and
+                  "self_centroid", and the Kx4 bounding boxes and Kx2
+                  centroids of the opponents, as "others" and "centroids".
+                  Empty if there is no player.
+        """
+        (h, w) = mask.shape
+        cars = self._buffer("cars", (h, 2 * w + 1))
+        np.bitwise_and(player, mask, out=cars[:, :w])
+        cars[:, w] = 0
+        np.bitwise_and(others, mask, out=cars[:, w + 1:])
+
+        if hasattr(cv2, "connectedComponentsWithStats"):
+            (_, _, stats, centroids) = cv2.connectedComponentsWithStats(
+                cars, labels=self._buffer("labels", cars.shape, np.int32),
+                connectivity=8)
         else:
-            contours, hierarchy = cv2.findContours(
-                thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+            (stats, centroids) = self.__labelCars(cars)
+        # Skip the background
+        (rects, areas) = (stats[1:, :4], stats[1:, 4])
+        centroids = centroids[1:]
 
-        if len(contours) == 0:
+        res = {}
+        players = np.nonzero(rects[:, 0] < w)[0]
+        if len(players) == 0:
             return res
-        else:
-            contours.sort(key=lambda c: cv2.contourArea(c), reverse=True)
-
-        res["self"] = cv2.boundingRect(contours[0])
 
-        # Detect the other cars
-        mask = np.logical_not(mask)
-        _, thresh = cv2.threshold(
-            cv2.cvtColor(image * mask, cv2.COLOR_BGR2GRAY), 80, 255, 0)
-
-        if self._is_cv3:
-            _, contours, hierarchy = cv2.findContours(
-                thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-        else:
-            contours, hierarchy = cv2.findContours(
-                thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        car = players[np.argmax(areas[players])]
+        res["self"] = rects[car]
+        res["self_centroid"] = centroids[car]
 
-        res["others"] = [cv2.boundingRect(c) for c in contours]
+        opponents = rects[:, 0] > w
+        res["others"] = rects[opponents] - (w + 1, 0, 0, 0)
+        res["centroids"] = centroids[opponents] - (w + 1, 0)
         return res
 
-    def __getStateGrid(self, grid, cars):
-        def center(rect):
-            return (rect[0] + int(0.5 * rect[2]),
-                    rect[1] + int(0.5 * rect[3]))
-
-        def inCell(i, j, pt):
-            c = np.asarray(
-                [grid[i][j], grid[i + 1][j],
-                 grid[i + 1][j + 1], grid[i][j + 1]])
-            return cv2.pointPolygonTest(c, pt, False) >= 0
-
-        def getCell(pt):
-            for i in range(len(grid) - 1):
-                for j in range(len(grid[i]) - 1):
-                    if inCell(i, j, pt):
-                        return (i, j)
-            return None
-
-        state = np.zeros((len(grid) - 1, len(grid[0]) - 1), np.uint8)
-        (pos_y, pos_x) = getCell(center(cars["self"]))
-        pos_y = len(grid) - pos_y - 2
-        state[pos_y, pos_x] = 2
-
-        for c in cars["others"]:
-            (pos_y, pos_x) = getCell(center(c))
-            pos_y = len(grid) - pos_y - 2
-
-            # Colision ocurred
-            while state[pos_y, pos_x] == 2:
-                pos_y += 1
-
-            state[pos_y, pos_x] = 1
+    def __labelCars(self, cars):
+        """ Returns the stats and centroids of the 8-connected components of
+        a mask, background first, as cv2.connectedComponentsWithStats()
+        does, from the outer contours of the components.
+        """
+        image = self._buffer("contours", cars.shape)
+        np.copyto(image, cars)
+        # OpenCV 3 also returns the image first. The components inside the
+        # holes of others have outer contours too, without a parent.
+        (contours, hierarchy) = cv2.findContours(
+            image, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)[-2:]
+        if hierarchy is not None:
+            rects = [cv2.boundingRect(c) for c in contours]
+            # The components go from the largest to the smallest, so that
+            # the ones inside others are painted over them
+            contours = sorted(
+                [(-r[2] * r[3], r, c) for (r, c, h) in
+                 zip(rects, contours, hierarchy[0]) if h[3] < 0],
+                key=lambda item: item[0])
+        else:
+            contours = []
+        n = len(contours) + 1
+
+        # Paint every component with its label, leaving out its holes
+        labels = self._buffer("labels", cars.shape, np.int32)
+        labels.fill(0)
+        for (i, (_, _, contour)) in enumerate(contours):
+            cv2.drawContours(labels, [contour], -1, i + 1, -1)
+        labels[cars == 0] = 0
+
+        (ys, xs) = np.nonzero(labels)
+        index = labels[ys, xs]
+        areas = np.bincount(index, minlength=n)
+        stats = np.zeros((n, 5), np.int32)
+        stats[1:, :4] = np.reshape([r for (_, r, _) in contours], (-1, 4))
+        stats[:, 4] = areas
+        centroids = np.stack([np.bincount(index, xs, n),
+                              np.bincount(index, ys, n)], axis=1) / \
+            np.maximum(areas, 1)[:, None]
+        return (stats, centroids)
+
+    def __getCellMap(self, grid, shape):
+        """ Returns an image where each pixel holds the flat index of the
+        cell of the road grid it belongs to, or -1 outside the road.
+        """
+        key = (shape, grid[:, :, 0].tobytes())
+        return self.__cached(self._cell_maps, key, "cell_map", shape,
+                             np.int16, self.__buildCellMap, grid)
+
+    def __buildCellMap(self, cell_map, grid):
+        # Cells are trapezoids between two horizon lines. Pixels on shared
+        # edges go to the first cell which contains them, as a sequential
+        # point in polygon test would. The edges of the road grids are sorted
+        # along every horizon line and the lines go down the screen, see
+        # __detectRoadGrid().
+        grid = np.asarray(grid, np.int64)
+        (cols, width) = (grid.shape[1] - 1, cell_map.shape[1])
+        cell_map.fill(-1)
+
+        # Band of each row, rows shared by two bands going to the first one
+        ys = grid[:, 0, 1]
+        rows = np.arange(ys[0], ys[-1] + 1)
+        bands = np.maximum(np.searchsorted(ys, rows) - 1, 0)
+        top = grid[bands, :, 0]
+        bottom = grid[bands + 1, :, 0]
+        height = (ys[bands + 1] - ys[bands])[:, None]
+
+        # A pixel is right of (or on) an edge from its first column and left
+        # of (or on) it up to its last column on that row
+        num = (bottom - top) * (rows - ys[bands])[:, None]
+        first = top - (-num // height)
+        last = top + num // height
+
+        # Since the edges are sorted, the first cell which may contain a
+        # pixel is the number of edges it is strictly right of, bar the first
+        # one which bounds no cell on its right. The pixel is in that cell if
+        # it is also right of (or on) its left edge, which pixels right of
+        # every edge never are. Both counts start at the first cell of the
+        # band, so that the cell is the flat index.
+        offsets = bands * cols
+        cells = self.__countEdges(last[:, 1:] + 1, offsets, width, "cells")
+        lefts = self.__countEdges(first[:, :-1], offsets, width, "lefts")
+        inside = np.greater(lefts, cells,
+                            out=self._buffer("inside", cells.shape, np.bool_))
+        np.copyto(cell_map[ys[0]:ys[-1] + 1], cells, where=inside)
+
+        return cell_map
+
+    def __countEdges(self, starts, offsets, width, name):
+        """ Returns the offset of each row plus the number of edges which
+        start at or before each column of the row, given the column each
+        edge starts at on each row.
+        """
+        rows = len(starts)
+        counts = self._buffer(name + "_starts", (rows, width + 1), np.intp)
+        counts.fill(0)
+        counts[:, 0] = offsets
+        np.add.at(counts, (np.arange(rows)[:, None],
+                           np.clip(starts, 0, width)), 1)
+        return np.cumsum(counts[:, :width], axis=1,
+                         out=self._buffer(name, (rows, width), np.intp))
+
+    def __getStateGrid(self, grid, cars, shape):
+        rows = len(grid) - 1
+        cols = len(grid[0]) - 1
+
+        # Centers of the player's car followed by the opponents
+        rects = np.concatenate([cars["self"][None], cars["others"]])
+        xs = rects[:, 0] + rects[:, 2] // 2
+        ys = rects[:, 1] + rects[:, 3] // 2
+
+        cells = self.__getCellMap(grid, shape)[ys, xs]
+        pos_y = rows - 1 - cells // cols
+        pos_x = cells % cols
+
+        state = np.zeros((rows, cols), np.uint8)
+        state[pos_y[0], pos_x[0]] = 2
+
+        # Ignore opponents outside of the road grid
+        others = cells[1:] >= 0
+        others_y = pos_y[1:][others]
+        others_x = pos_x[1:][others]
+
+        # Colision ocurred
+        others_y[np.logical_and(others_y == pos_y[0],
+                                others_x == pos_x[0])] += 1
+
+        state[others_y, others_x] = 1
 
         return state
 
@@ -234,10 +562,15 @@ class StateExtractor:
         for r in cars["others"]:
             cv2.rectangle(image, tl(r), br(r), (0x43, 0x04, 0xAE), 2)
 
-    def __draw(self, image, scale):
-        scaled_image = cv2.resize(image, None, fx=scale, fy=scale)
-        if scaled_image.shape != image.shape:
-            image.resize(scaled_image.shape, refcheck=False)
-        np.copyto(image, scaled_image)
-        self.__drawRoadGrid(image, self._road_grid, scale)
-        self.__drawCars(image, self._cars, scale, 5)
+    def __render(self, screen, road_grid, cars, draw, scale):
+        image = self._getImage(screen)
+        if not draw:
+            return image
+
+        (h, w) = (int(round(scale * image.shape[0])),
+                  int(round(scale * image.shape[1])))
+        image = cv2.resize(image, (w, h),
+                           dst=self._buffer("canvas", (h, w, 3)))
+        self.__drawRoadGrid(image, road_grid, scale)
+        self.__drawCars(image, cars, scale, 5)
+        return image
@@ -0,0 +1,274 @@
+import ctypes
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from enduro.action import Action
+from enduro.agent import Agent
+from enduro.control import Controller
+from enduro.state import StateExtractor
+
+
+class EmulatorWorker(multiprocessing.Process):
+    """ Runs an emulator in its own process for VecAgent.
+
+    The worker executes the commands it receives through its pipe and writes
+    the environment grids straight into a slot of the shared grid buffer.
+    Every command is answered with a (reward, iteration, done) tuple, or with
+    the exception which stopped the worker. Episodes which are over are
+    restarted right away.
+    """
+
+    def __init__(self, pipe, grids, index, extractor=StateExtractor,
+                 schedule=None, repeat=8, seed=123):
+        """
+        Args:
+            pipe (Connection): The worker end of the command pipe.
+            grids (RawArray): The Nx2x11x10 shared grid buffer.
+            index (int): The index of the worker in the grid buffer.
+            extractor (callable): Builds the environment grid extractor.
+            schedule (dict): The number of frames each action is repeated
+                             for, see Controller.SCHEDULE.
+            repeat (int): The number of frames the other actions are
+                          repeated for.
+            seed (int): The random seed of the emulator.
+        """
+        super(EmulatorWorker, self).__init__()
+        self.daemon = True
+        self._pipe = pipe
+        self._buffer = grids
+        self._index = index
+        self._extractor = extractor
+        self._schedule = schedule
+        self._repeat = repeat
+        self._seed = seed
+
+    def run(self):
+        try:
+            self.__serve()
+        except Exception:
+            self._pipe.send(RuntimeError(traceback.format_exc()))
+
+    def __serve(self):
+        frame_skip = Controller.frameSkip(self._schedule, self._repeat)
+        ale = Agent.createEmulator(self._seed, frame_skip)
+        controller = Controller(ale, self._schedule, self._repeat, frame_skip)
+        extractor = self._extractor(ale)
+        grids = np.frombuffer(self._buffer, np.uint8).reshape(
+            (-1, 2) + VecAgent.GRID_SHAPE)[self._index]
+
+        def observe(slot):
+            (grid, _) = extractor.run(image=False)
+            grids[slot] = grid
+
+        def reset():
+            ale.reset_game()
+            observe(1)
+            return ale.getFrameNumber()
+
+        num_frames = ale.getFrameNumber()
+        while True:
+            (command, action) = self._pipe.recv()
+            if command == "close":
+                break
+            if command == "reset":
+                num_frames = reset()
+                self._pipe.send((0, 0, False))
+                continue
+
+            reward = controller.move(int(action))
+            observe(0)
+            iteration = ale.getFrameNumber() - num_frames
+
+            # Each episode lasts 6500 frames
+            done = iteration >= 6500
+            if done:
+                num_frames = reset()
+            self._pipe.send((reward, iteration, done))
+
+
+class VecAgent(object):
+    """ Runs N emulators in worker processes and steps them in lockstep.
+
+    Subclasses implement the same functions as for Agent, except that they
+    handle all the emulators at once: act() chooses N actions and executes
+    them with self.move(), sense() receives the Nx11x10 grids and
+    initialise() the grids of the emulators which start a new episode.
+    """
+
+    GRID_SHAPE = (11, 10)
+
+    def __init__(self, n, extractor=StateExtractor, schedule=None, repeat=8,
+                 seed=123):
+        """ Starts the emulator processes.
+
+        Args:
+            n (int): The number of emulators.
+            extractor (callable): Builds the environment grid extractor, see
+                                  Agent.
+            schedule (dict): The number of frames each action is repeated
+                             for, see Controller.SCHEDULE.
+            repeat (int): The number of frames the other actions are
+                          repeated for.
+            seed (int): The random seed of the first emulator, the others
+                        get the following ones.
+        """
+        self.n = n
+
+        # Slot 0 holds the grid after the last action and slot 1 the initial
+        # grid of the last episode started
+        self._buffer = multiprocessing.RawArray(
+            ctypes.c_uint8, n * 2 * int(np.prod(VecAgent.GRID_SHAPE)))
+        self._grids = np.frombuffer(self._buffer, np.uint8).reshape(
+            (n, 2) + VecAgent.GRID_SHAPE)
+
+        self._pipes = []
+        self._workers = []
+        for i in range(n):
+            (pipe, worker_pipe) = multiprocessing.Pipe()
+            worker = EmulatorWorker(worker_pipe, self._buffer, i, extractor,
+                                    schedule, repeat, seed + i)
+            worker.start()
+            worker_pipe.close()
+            self._pipes.append(pipe)
+            self._workers.append(worker)
+
+        self._episode = np.ones(n, np.int64)
+        self._iteration = np.zeros(n, np.int64)
+        self._done = np.zeros(n, np.bool_)
+
+    def __command(self, command, actions):
+        for (pipe, action) in zip(self._pipes, actions):
+            pipe.send((command, action))
+
+        replies = [pipe.recv() for pipe in self._pipes]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+        (rewards, self._iteration[:], self._done[:]) = zip(*replies)
+        return np.asarray(rewards)
+
+    def run(self, learn, episodes=1):
+        """ Implements the playing/learning loop over all the emulators.
+
+        Args:
+            learn (bool): Whether the self.learn() function should be called.
+            episodes (int): The total number of episodes to run, over all the
+                            emulators. The episodes still running by then
+                            are cut short.
+
+        Returns:
+            None
+        """
+        self.__command("reset", [None] * self.n)
+        self._episode.fill(1)
+        self.initialise(np.copy(self._grids[:, 1]), np.arange(self.n))
+
+        finished = 0
+        while finished < episodes:
+            # Take an action in every emulator
+            self.act()
+
+            # Update the environment grids
+            self.sense(np.copy(self._grids[:, 0]))
+
+            # Perform learning if required
+            if learn:
+                self.learn()
+
+            self.callback(learn, np.copy(self._episode),
+                          np.copy(self._iteration))
+
+            # Start the next episode of the emulators which are done
+            envs = np.nonzero(self._done)[0]
+            if envs.size:
+                finished += envs.size
+                self._episode[envs] += 1
+                self.initialise(self._grids[envs, 1], envs)
+
+    def close(self):
+        """ Stops the emulator processes.
+        """
+        for pipe in self._pipes:
+            pipe.send(("close", None))
+        for worker in self._workers:
+            worker.join()
+        self._pipes = []
+        self._workers = []
+
+    def getActionsSet(self):
+        """ Returns the set of all possible actions
+        """
+        return [Action.ACCELERATE, Action.RIGHT, Action.LEFT, Action.BRAKE]
+
+    def move(self, actions):
+        """ Executes an action in every emulator and advances them all to
+        their next state. Emulators whose episode is over start a new one.
+
+        Args:
+            actions (list): The N actions to execute, taken from the
+                            constants returned by self.getActionsSet()
+
+        Returns:
+            np.ndarray: The N obtained rewards
+        """
+        return self.__command("move", actions)
+
+    def initialise(self, grids, envs):
+        """ Called at the beginning of each episode of any of the emulators.
+
+        Args:
+            grids (np.ndarray): Kx11x10 array with the initial environment
+                                grids.
+            envs (np.ndarray): The indices of the K emulators.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def act(self):
+        """ Called at each loop iteration to choose and execute the actions
+        of all the emulators.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def sense(self, grids):
+        """ Called at each loop iteration to construct the new states from
+        the Nx11x10 updated environment grids. The grid of an emulator whose
+        episode just ended is the last one of that episode.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def learn(self):
+        """ Called at each loop iteration when the agent is learning. It should
+        implement the learning procedure over the N transitions.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def callback(self, learn, episode, iteration):
+        """ Called at each loop iteration mainly for reporting purposes.
+        self._done tells which emulators have just finished their episode.
+
+        Args:
+            learn (bool): Indicates whether the agent is learning or not.
+            episode (np.ndarray): The number of the current episode of each
+                                  emulator.
+            iteration (np.ndarray): The number of the current iteration of
+                                    each emulator.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
@@ -0,0 +1,28 @@
+import argparse
+
+from enduro.checkpoint import Checkpoint
+from enduro.evaluation import PolicyEvaluator
+from q_agent import QAgent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluates the greedy policy of a QAgent checkpoint, "
+                    "without learning nor exploring.")
+    parser.add_argument("checkpoint")
+    parser.add_argument("--episodes", type=int, default=10)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[123])
+    args = parser.parse_args()
+
+    agent = QAgent()
+    if not Checkpoint(args.checkpoint).restore(agent):
+        parser.error("{0} does not exist".format(args.checkpoint))
+
+    evaluator = PolicyEvaluator(agent.freeze(), agent.buildState)
+    rewards = evaluator.run(args.episodes, args.seeds)
+    (mean, error) = PolicyEvaluator.summary(rewards)
+
+    for (seed, r) in zip(args.seeds, rewards):
+        print "Seed {0}: {1}".format(seed, " ".join(str(x) for x in r))
+    print "Mean total reward: {0:.1f} +- {1:.1f} (95% CI, {2} episodes)".format(
+        mean, error, rewards.size)
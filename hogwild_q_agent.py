@@ -0,0 +1,15 @@
+from enduro.history import LogWriter
+from enduro.hogwild import HogwildTrainer
+from q_agent import QAgent
+
+
+if __name__ == "__main__":
+    # Learn a single Q table with one actor per core for an hour
+    trainer = HogwildTrainer(QAgent, QAgent.initialQ())
+    log = trainer.train(budget=3600)
+    print 'Episodes per actor: ' + str(trainer.episodes)
+
+    log_writer = LogWriter("log.bin", trainer.Q.shape)
+    for (iters, rewards, Q) in log:
+        log_writer.write(iters, rewards, Q)
+    log_writer.close()
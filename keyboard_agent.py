@@ -17,9 +17,6 @@ class KeyboardAgent(Agent):
         # Reset the total reward for the episode
         self.total_reward = 0
 
-        cv2.imshow("Enduro", self._image)
-        cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
-
     def act(self):
         """ Implements the decision making process for selecting
         an action. Remember to store the obtained reward.
@@ -52,8 +49,7 @@ class KeyboardAgent(Agent):
         gird -- 2-dimensional numpy array containing the latest grid
                 representation of the environment
         """
-        # Visualise the environment grid
-        cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
+        pass
 
     def learn(self):
         """ Performs the learning procudre. It is called after act() and
@@ -65,7 +61,12 @@ class KeyboardAgent(Agent):
         """ Called at the end of each timestep for reporting/debugging purposes.
         """
         print "{0}/{1}: {2}".format(episode, iteration, self.total_reward)
-        # Show the latest game frame
+
+    def render(self, grid, episode, iteration):
+        """ Called on the rendered timesteps for visualisation purposes.
+        """
+        # Show the environment grid and the latest game frame
+        cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
         cv2.imshow("Enduro", self._image)
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
+import sys
+
 import numpy as np
-import pickle
 
 import matplotlib.pylab as plt
 
-log = pickle.load(open("log.p", "rb"))
+from enduro.history import LogReader
+
+# The log is memory mapped and only the episodes plotted are read
+log = LogReader(sys.argv[1] if len(sys.argv) > 1 else "log.bin")
+episodes, total_rewards = log.curve(points=500)
 
 plt.subplot(211)
 plt.title("Learning Curve")
 plt.xlabel("Episode")
 plt.ylabel("Total Reward")
-curve, = plt.plot([e[1][-1] for e in log], 'b')
+plt.xlim(0, max(len(log) - 1, 1))
+plt.ylim(min(0, np.min(total_rewards)), np.max(total_rewards) + 1)
+curve, = plt.plot([], [], 'b')
 
 plt.subplot(212)
 plt.title("Greedy Policy")
@@ -20,7 +27,7 @@ cm = base_cmap.from_list('GnBu4', base_cmap(np.linspace(0, 1, 4)), 4)
 plt.gca().set_xticks(np.arange(-.5, 10, 1.0), minor=True)
 plt.gca().set_yticks(np.arange(-.5, 11, 1.005), minor=True)
 plt.grid(which='minor')
-im = plt.imshow(np.argmax(log[-1][2], axis=2).transpose(),
+im = plt.imshow(np.argmax(log.episode(len(log) - 1)[2], axis=2).transpose(),
                 interpolation='nearest', cmap=cm, origin='lower')
 
 cbar = plt.colorbar()
@@ -28,11 +35,11 @@ cbar.set_clim(0, 3)
 cbar.set_ticks([0, 0.375, 1.125, 1.875, 2.625, 3])
 cbar.set_ticklabels(['', 'Accelerate', 'Right', 'Left', 'Brake', ''])
 
-total_rewards = [e[1][-1] for e in log]
-empty_rewards = [None] * len(log)
-for i in xrange(len(log)):
-    curve.set_ydata(total_rewards[:i] + empty_rewards[i:])
-    im.set_data(np.argmax(log[i][2], axis=2).transpose())
+# Replay the curve point by point, with the policy of the last episode of
+# each point
+for i in xrange(len(episodes)):
+    curve.set_data(episodes[:i + 1], total_rewards[:i + 1])
+    im.set_data(np.argmax(log.episode(episodes[i])[2], axis=2).transpose())
     plt.draw()
     plt.pause(0.001)
 
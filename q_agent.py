@@ -1,29 +1,61 @@
-import cv2
+import os
+
 import numpy as np
-import pickle
 
 from enduro.agent import Agent
 from enduro.action import Action
-from enduro.state import EnvironmentState
+from enduro.checkpoint import Checkpoint
+from enduro.encoder import ClosestOpponentEncoder
+from enduro.evaluation import greedyPolicy
+from enduro.history import LogWriter
+from enduro.memory import batchUpdate
+from enduro.sink import ConsoleOutput, RenderSink, WindowOutput
 
 
 class QAgent(Agent):
-    def __init__(self):
-        super(QAgent, self).__init__()
+    def __init__(self, alpha=0.01, gamma=0.9, epsilon=0.01, horizon_row=None,
+                 memory=None, batch_size=32, log_writer=None, encoder=None,
+                 table=None, **kwargs):
+        """
+        Args:
+            alpha (float): The learning rate.
+            gamma (float): The discounting factor.
+            epsilon (float): The exploration rate.
+            horizon_row (int): The number of rows of the grid which the agent
+                               sees opponents on, all of them if None.
+            memory (ReplayMemory): Keeps the transitions to learn from a
+                                   batch of them again after every step,
+                                   see enduro.memory. Each transition is
+                                   only learned from once if None.
+            batch_size (int): The number of transitions replayed per step.
+            log_writer (LogWriter): Streams the log of every step and episode
+                                    to a file, see enduro.history. The log is
+                                    kept in self.log if None.
+            encoder (StateEncoder): Builds the states from the grids, see
+                                    enduro.encoder. ClosestOpponentEncoder
+                                    with the horizon_row if None.
+            table (np.ndarray|HashedQTable): The Q table, with a row of
+                                             action values per state. A
+                                             dense one for the states of the
+                                             encoder if None. Large encodings
+                                             need a HashedQTable, see
+                                             enduro.qtable.
+        """
+        super(QAgent, self).__init__(**kwargs)
         # The horizon defines how far the agent can see
-        self.horizon_row = 5
+        self.horizon_row = horizon_row
 
         self.grid_cols = 10
-        # The state is defined as a tuple of the agent's x position and the
-        # x position of the closest opponent which is lower than the horizon,
-        # if any is present. There are four actions and so the Q(s, a) table
-        # has size of 10 * (10 + 1) * 4 = 440.
-        self.Q = np.ones((self.grid_cols, self.grid_cols + 1, 4))
-
-        # Add initial bias toward moving forward. This is not necessary,
-        # however it speeds up learning significantly, since the game does
-        # not provide negative reward if no cars have been passed by.
-        self.Q[:, :, 0] += 1.
+        if encoder is None:
+            encoder = ClosestOpponentEncoder(self.grid_cols, horizon_row)
+            if table is None:
+                table = QAgent.initialQ(self.grid_cols)
+        if table is None:
+            # Same bias towards accelerating as initialQ()
+            table = np.ones((encoder.size, 4))
+            table[:, 0] += 1.
+        self.encoder = encoder
+        self.Q = table
 
         # Helper dictionaries that allow us to move from actions to
         # Q table indices and vice versa
@@ -31,17 +63,66 @@ class QAgent(Agent):
         self.act2idx = {a: i for i, a in enumerate(self.getActionsSet())}
 
         # Learning rate
-        self.alpha = 0.01
+        self.alpha = alpha
         # Discounting factor
-        self.gamma = 0.9
+        self.gamma = gamma
         # Exploration rate
-        self.epsilon = 0.01
+        self.epsilon = epsilon
+
+        self.memory = memory
+        self.batch_size = batch_size
 
         # Log the obtained reward during learning
-        self.last_episode = 1
+        self.log_writer = log_writer
         self.episode_log = np.zeros(6510) - 1.
         self.log = []
 
+    def getCheckpoint(self):
+        state = super(QAgent, self).getCheckpoint()
+        state.update({
+            "Q": np.copy(self.Q) if isinstance(self.Q, np.ndarray) else self.Q,
+            "alpha": self.alpha,
+            "gamma": self.gamma,
+            "epsilon": self.epsilon,
+            "horizon_row": self.horizon_row,
+            "log": self.log,
+            "log_size": None if self.log_writer is None
+            else self.log_writer.tell()})
+        return state
+
+    def setCheckpoint(self, state):
+        super(QAgent, self).setCheckpoint(state)
+        # Dense tables may be shared, e.g. by HogwildTrainer
+        if isinstance(self.Q, np.ndarray):
+            self.Q[...] = state["Q"]
+        else:
+            self.Q = state["Q"]
+        self.alpha = state["alpha"]
+        self.gamma = state["gamma"]
+        self.epsilon = state["epsilon"]
+        self.horizon_row = state["horizon_row"]
+        if isinstance(self.encoder, ClosestOpponentEncoder):
+            self.encoder.horizon_row = self.horizon_row
+        self.log = state["log"]
+        # Drop the episodes logged after the checkpoint
+        if self.log_writer is not None and state["log_size"] is not None:
+            self.log_writer.truncate(state["log_size"])
+
+    @staticmethod
+    def initialQ(grid_cols=10):
+        # The state is defined by the agent's x position and the x position
+        # of the closest opponent which is lower than the horizon, if any is
+        # present, see ClosestOpponentEncoder. There are four actions and so
+        # the Q(s, a) table has size of 10 * (10 + 1) * 4 = 440. The flat
+        # state index addresses its first two axes.
+        Q = np.ones((grid_cols, grid_cols + 1, 4))
+
+        # Add initial bias toward moving forward. This is not necessary,
+        # however it speeds up learning significantly, since the game does
+        # not provide negative reward if no cars have been passed by.
+        Q[:, :, 0] += 1.
+        return Q
+
     def initialise(self, grid):
         """ Called at the beginning of an episode. Use it to construct
         the initial state.
@@ -59,7 +140,7 @@ class QAgent(Agent):
         # If exploring
         if np.random.uniform(0., 1.) < self.epsilon:
             # Select a random action using softmax
-            Q_s = self.Q[self.state[0], self.state[1], :]
+            Q_s = self.actionValues(self.state)
             probs = np.exp(Q_s) / np.sum(np.exp(Q_s))
             idx = np.random.choice(4, p=probs)
             self.action = self.idx2act[idx]
@@ -73,72 +154,94 @@ class QAgent(Agent):
     def sense(self, grid):
         self.next_state = self.buildState(grid)
 
-        # Visualise the environment grid
-        cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
-
     def learn(self):
-        # Read the current state-action value
-        Q_sa = self.Q[self.state[0], self.state[1], self.act2idx[self.action]]
+        # Read the next state's value first, since a hashed table may grow
+        # when it adds the state, and then the current state-action value
+        Q_next = self.maxQsa(self.next_state)
+        Q_s = self.actionValues(self.state)
+        Q_sa = Q_s[self.act2idx[self.action]]
 
         # Calculate the updated state action value
-        Q_sa_new = Q_sa + self.alpha * (self.reward + self.gamma * self.maxQsa(self.next_state) - Q_sa)
+        Q_sa_new = Q_sa + self.alpha * (self.reward + self.gamma * Q_next - Q_sa)
 
         # Write the updated value
-        self.Q[self.state[0], self.state[1], self.act2idx[self.action]] = Q_sa_new
+        Q_s[self.act2idx[self.action]] = Q_sa_new
+
+        # Learn from a batch of the past transitions too
+        if self.memory is not None:
+            self.memory.add(self.state, self.act2idx[self.action],
+                            self.reward, self.next_state)
+            if len(self.memory) >= self.batch_size:
+                batchUpdate(self.Q, *self.memory.sample(self.batch_size),
+                            alpha=self.alpha, gamma=self.gamma)
 
     def callback(self, learn, episode, iteration):
         if not iteration % 1000:
-            print "{0}/{1}: {2}".format(episode, iteration, self.total_reward)
+            self.report("{0}/{1}: {2}".format(
+                episode, iteration, self.total_reward))
 
-        # Initialise the log for the next episode
-        if episode != self.last_episode:
-            iters = np.nonzero(self.episode_log >= 0)
-            rewards = self.episode_log[iters]
-            self.log.append((np.asarray(iters).flatten(), rewards, np.copy(self.Q)))
-            self.last_episode = episode
-            self.episode_log = np.zeros(6510) - 1.
+        if self.log_writer is not None:
+            self.log_writer.step(iteration, self.total_reward)
+            if iteration >= 6500:
+                self.log_writer.endEpisode(self.__snapshot())
+            return
 
         # Log the reward at the current iteration
         self.episode_log[iteration] = self.total_reward
 
-        if not episode % 100:
-            cv2.imshow("Enduro", self._image)
-            cv2.waitKey(20)
+        # Log the episode once its 6500 frames are over and initialise the
+        # log for the next one
+        if iteration >= 6500:
+            iters = np.nonzero(self.episode_log >= 0)
+            rewards = self.episode_log[iters]
+            self.log.append((np.asarray(iters).flatten(), rewards, self.__snapshot()))
+            self.episode_log = np.zeros(6510) - 1.
+
+    def __snapshot(self):
+        """ Returns the copy of the Q table kept by the log, None for hashed
+        tables which may be too large to copy every episode.
+        """
+        return np.copy(self.Q) if isinstance(self.Q, np.ndarray) else None
 
     def buildState(self, grid):
-        state = [0, 0]
-
-        # Agent position (assumes the agent is always on row 0)
-        [[x]] = np.argwhere(grid[0, :] == 2)
-        state[0] = x
-
-        # Sum the rows of the grid
-        rows = np.sum(grid, axis=1)
-        # Ignore the agent
-        rows[0] -= 2
-        # Get the closest row where an opponent is present
-        rows = np.sort(np.argwhere(rows > 0).flatten())
-
-        # If any opponent is present
-        if rows.size > 0:
-            # Add the x position of the first opponent on the closest row
-            row = rows[0]
-            for i, g in enumerate(grid[row, :]):
-                if g == 1:
-                    # 0 means that no agent is present and so
-                    # the index is offset by 1
-                    state[1] = i + 1
-                    break
-        return state
+        """ Returns the flat state index of a grid, see self.encoder.
+        """
+        return self.encoder.encode(grid)
+
+    def freeze(self):
+        """ Returns the greedy policy as the ALE action of every flat state
+        index of a dense Q table, see enduro.evaluation.
+        """
+        if not isinstance(self.Q, np.ndarray):
+            raise ValueError("only dense Q tables can be frozen")
+        return greedyPolicy(self.Q, self.getActionsSet())
+
+    def actionValues(self, state):
+        """ Returns the row of Q(s, a) values of a state, a view of the
+        table.
+        """
+        if isinstance(self.Q, np.ndarray):
+            return self.Q.reshape(-1, 4)[state]
+        return self.Q.row(state)
 
     def maxQsa(self, state):
-        return np.max(self.Q[state[0], state[1], :])
+        return np.max(self.actionValues(state))
 
     def argmaxQsa(self, state):
-        return np.argmax(self.Q[state[0], state[1], :])
+        return np.argmax(self.actionValues(state))
 
 
 if __name__ == "__main__":
-    a = QAgent()
-    a.run(True, episodes=500, draw=True)
-    pickle.dump(a.log, open("log.p", "wb"))
+    # Visualise the environment grid and the game frames of every 100th
+    # episode, and print the reports, on a background thread
+    sink = RenderSink([WindowOutput(), ConsoleOutput()])
+    # Stream the log to disk as the episodes go, see plot_log.py, and
+    # resume from the last checkpoint of an interrupted run, if any
+    checkpoint = Checkpoint("q_agent.ckpt", interval=10)
+    log_writer = LogWriter("log.bin", QAgent.initialQ().shape,
+                           append=os.path.exists(checkpoint.path))
+    a = QAgent(log_writer=log_writer)
+    a.run(True, episodes=500, draw=True, render_episodes=100, sink=sink,
+          checkpoint=checkpoint)
+    sink.close()
+    log_writer.close()
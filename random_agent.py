@@ -1,14 +1,13 @@
-import cv2
 import numpy as np
 
 from enduro.agent import Agent
 from enduro.action import Action
-from enduro.state import EnvironmentState
+from enduro.sink import ConsoleOutput, RenderSink, WindowOutput
 
 
 class RandomAgent(Agent):
-    def __init__(self):
-        super(RandomAgent, self).__init__()
+    def __init__(self, **kwargs):
+        super(RandomAgent, self).__init__(**kwargs)
         # Add member variables to your class here
         self.total_reward = 0
 
@@ -34,8 +33,7 @@ class RandomAgent(Agent):
         gird -- 2-dimensional numpy array containing the latest grid
                 representation of the environment
         """
-        # Visualise the environment grid
-        cv2.imshow("Environment Grid", EnvironmentState.draw(grid))
+        pass
 
     def learn(self):
         """ Performs the learning procudre. It is called after act() and
@@ -46,12 +44,15 @@ class RandomAgent(Agent):
     def callback(self, learn, episode, iteration):
         """ Called at the end of each timestep for reporting/debugging purposes.
         """
-        print "{0}/{1}: {2}".format(episode, iteration, self.total_reward)
-        cv2.imshow("Enduro", self._image)
-        cv2.waitKey(40)
+        self.report("{0}/{1}: {2}".format(
+            episode, iteration, self.total_reward))
 
 
 if __name__ == "__main__":
+    # Visualise the environment grid and the game frames, and print the
+    # reports, on a background thread
+    sink = RenderSink([WindowOutput(), ConsoleOutput()])
     a = RandomAgent()
-    a.run(False, episodes=2, draw=True)
+    a.run(False, episodes=2, draw=True, sink=sink)
+    sink.close()
     print 'Total reward: ' + str(a.total_reward)
@@ -0,0 +1,295 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import traceback
+
+import numpy as np
+
+from q_agent import QAgent
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+
+# The queue of the runs' messages and the shared array of the processes of
+# the runs, set up in every worker of the pool
+_queue = None
+_workers = None
+
+
+def _initWorker(queue, workers):
+    global _queue, _workers
+    (_queue, _workers) = (queue, workers)
+    # Interruptions are handled by the sweep, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _runOne(make_agent, index, key, params, seed, episodes):
+    """ Plays and learns the episodes of a run in the emulator of the worker
+    and streams their total rewards to the sweep.
+    """
+    # Lets the sweep tell whether the worker of the run died. Unlike the
+    # messages, which a thread sends, this is visible right away.
+    _workers[index] = os.getpid()
+    try:
+        np.random.seed(seed)
+        agent = make_agent(seed=seed, **params)
+        # The reports of the runs would interleave
+        agent.report = lambda text: None
+
+        for e in range(episodes):
+            agent.run(True, episodes=1, headless=True)
+            _queue.put(("episode", key, agent.log[-1][1][-1]))
+            del agent.log[:]
+        _queue.put(("done", key, None))
+    except Exception:
+        _queue.put(("error", key, traceback.format_exc()))
+
+
+class Sweep(object):
+    def __init__(self, configs, seeds=(123,), episodes=500, store="sweep.jsonl",
+                 make_agent=QAgent, processes=None):
+        """ Runs an agent with every configuration and seed, spread over a
+        pool of processes, each with its own emulator.
+
+        The total reward of every episode is appended to a JSON lines store
+        as soon as it arrives. The runs which finished in the store already
+        are skipped, so an interrupted sweep resumes where it stopped.
+
+        Args:
+            configs (list): The keyword arguments of the agent of every
+                            configuration, see grid() and randomSearch().
+            seeds (list): The seeds every configuration is run with.
+            episodes (int): The number of episodes of every run.
+            store (str): The JSON lines file of the results.
+            make_agent (callable): Builds the agent from a seed and a
+                                   configuration, e.g. QAgent. It must log
+                                   its episodes in its log attribute.
+            processes (int): The number of processes, one per core by
+                             default.
+        """
+        self._runs = []
+        keys = set()
+        for params in configs:
+            for seed in seeds:
+                key = Sweep.key(params, seed)
+                if key not in keys:
+                    keys.add(key)
+                    self._runs.append((key, params, seed))
+        self._episodes = episodes
+        self._store = store
+        self._make_agent = make_agent
+        self._processes = processes or multiprocessing.cpu_count()
+
+    @staticmethod
+    def key(params, seed):
+        """ Returns the identifier of a run in the store.
+        """
+        return json.dumps([sorted(params.items()), seed])
+
+    @staticmethod
+    def grid(**values):
+        """ Returns every combination of the given values of the parameters,
+        e.g. grid(alpha=[0.01, 0.1], gamma=[0.9, 0.99]).
+        """
+        names = sorted(values)
+        return [dict(zip(names, combination)) for combination in
+                itertools.product(*[values[name] for name in names])]
+
+    @staticmethod
+    def randomSearch(n, seed=0, **ranges):
+        """ Returns configurations drawn uniformly from the given ranges,
+        e.g. randomSearch(20, alpha=(0.001, 0.1), horizon_row=(3, 11)). The
+        parameters whose bounds are both integers are drawn as integers,
+        upper bound included.
+        """
+        random = np.random.RandomState(seed)
+        configs = []
+        for i in range(n):
+            config = {}
+            for (name, (low, high)) in sorted(ranges.items()):
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = int(random.randint(low, high + 1))
+                else:
+                    config[name] = float(random.uniform(low, high))
+            configs.append(config)
+        return configs
+
+    @staticmethod
+    def load(store):
+        """ Reads the results of a sweep.
+
+        Returns:
+            dict: The params, seed, episode rewards and whether it finished
+                  of every run by its key. Only the episodes of the last
+                  attempt of every run are kept.
+        """
+        runs = {}
+        if not os.path.exists(store):
+            return runs
+        for line in open(store):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if record["type"] == "start":
+                runs[record["key"]] = {
+                    "params": record["params"], "seed": record["seed"],
+                    "rewards": [], "done": False}
+            elif record["key"] not in runs:
+                continue
+            elif record["type"] == "episode":
+                runs[record["key"]]["rewards"].append(record["reward"])
+            elif record["type"] == "done":
+                runs[record["key"]]["done"] = True
+        return runs
+
+    def run(self):
+        """ Runs the runs which have not finished yet. Ctrl-C stops them,
+        keeping the ones which finished.
+
+        Returns:
+            dict: The results of all the runs, see load().
+        """
+        done = set(key for (key, run) in Sweep.load(self._store).items()
+                   if run["done"])
+        runs = [run for run in self._runs if run[0] not in done]
+
+        queue = multiprocessing.Queue()
+        workers = multiprocessing.RawArray("l", len(runs))
+        pool = multiprocessing.Pool(self._processes, _initWorker,
+                                    (queue, workers))
+        store = open(self._store, "a+")
+        # End a line cut short by an interruption
+        store.seek(0, os.SEEK_END)
+        if store.tell():
+            store.seek(store.tell() - 1)
+            if store.read(1) != "\n":
+                store.write("\n")
+
+        def write(record):
+            store.write(json.dumps(record) + "\n")
+            store.flush()
+
+        results = [pool.apply_async(_runOne, (self._make_agent, i, key, params,
+                                              seed, self._episodes))
+                   for (i, (key, params, seed)) in enumerate(runs)]
+
+        # A run starts in the store with its first message, so that the
+        # episodes of an earlier attempt are dropped by load()
+        indices = dict((run[0], i) for (i, run) in enumerate(runs))
+        runs = dict((key, (params, seed)) for (key, params, seed) in runs)
+        started = set()
+        # The runs which are done and the ones which looked lost at the last
+        # timeout
+        done = set()
+        lost = set()
+        error = None
+        try:
+            while len(done) < len(runs):
+                try:
+                    (kind, key, value) = queue.get(timeout=1.0)
+                except Empty:
+                    # The pool replaces dead workers and forgets their runs,
+                    # so a run whose worker died, or which returned without
+                    # a word, is lost. Its last messages are in the queue by
+                    # the next timeout, so it failed if it is still not done.
+                    for key in lost - done:
+                        done.add(key)
+                        error = error or RuntimeError(
+                            "run {0} stopped without finishing".format(key))
+                    alive = set(p.pid for p in
+                                multiprocessing.active_children())
+                    lost = set(key for (key, i) in indices.items()
+                               if key not in done and (
+                                   results[i].ready() or
+                                   workers[i] and workers[i] not in alive))
+                    continue
+
+                if key in done:
+                    continue
+                if key not in started:
+                    started.add(key)
+                    (params, seed) = runs[key]
+                    write({"type": "start", "key": key, "params": params,
+                           "seed": seed})
+                if kind == "episode":
+                    write({"type": "episode", "key": key, "reward": value})
+                elif kind == "done":
+                    write({"type": "done", "key": key})
+                    done.add(key)
+                else:
+                    error = error or RuntimeError(value)
+                    done.add(key)
+        except KeyboardInterrupt:
+            pool.terminate()
+        else:
+            # The pool would wait for the results of lost runs forever
+            if error is None:
+                pool.close()
+            else:
+                pool.terminate()
+        pool.join()
+        store.close()
+
+        if error is not None:
+            raise error
+        return Sweep.load(self._store)
+
+    @staticmethod
+    def summary(results, last=100):
+        """ Returns the mean and standard deviation over the seeds of the
+        mean total reward of the last episodes of every finished run, by
+        configuration, best first.
+        """
+        rewards = {}
+        for run in results.values():
+            if run["done"] and run["rewards"]:
+                config = json.dumps(sorted(run["params"].items()))
+                rewards.setdefault(config, []).append(
+                    np.mean(run["rewards"][-last:]))
+        summary = [(dict(json.loads(config)), np.mean(r), np.std(r), len(r))
+                   for (config, r) in rewards.items()]
+        return sorted(summary, key=lambda s: -s[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs QAgent with every combination of the given values "
+                    "of its parameters, or with --random configurations "
+                    "drawn between their smallest and largest values, and "
+                    "every seed.")
+    parser.add_argument("--alpha", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--gamma", type=float, nargs="+", default=[0.9])
+    parser.add_argument("--epsilon", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--horizon-row", type=int, nargs="+", default=[11])
+    parser.add_argument("--random", type=int, default=0,
+                        help="the number of random configurations, 0 for "
+                             "the grid")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[123])
+    parser.add_argument("--episodes", type=int, default=500)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--store", default="sweep.jsonl")
+    args = parser.parse_args()
+
+    values = {"alpha": args.alpha, "gamma": args.gamma,
+              "epsilon": args.epsilon, "horizon_row": args.horizon_row}
+    if args.random:
+        configs = Sweep.randomSearch(
+            args.random, **dict((name, (min(v), max(v)))
+                                for (name, v) in values.items()))
+    else:
+        configs = Sweep.grid(**values)
+
+    results = Sweep(configs, args.seeds, args.episodes, args.store,
+                    processes=args.processes).run()
+
+    for (params, mean, std, n) in Sweep.summary(results):
+        print "{0:8.1f} +- {1:6.1f} ({2} seeds) {3}".format(
+            mean, std, n, json.dumps(params, sort_keys=True))
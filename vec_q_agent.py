@@ -0,0 +1,80 @@
+import multiprocessing
+import numpy as np
+
+from enduro.encoder import ClosestOpponentEncoder
+from enduro.memory import batchUpdate
+from enduro.vec import VecAgent
+from q_agent import QAgent
+
+
+class VecQAgent(VecAgent):
+    def __init__(self, n):
+        super(VecQAgent, self).__init__(n)
+        self.grid_cols = 10
+        # The same state and Q(s, a) table as QAgent, learned from the
+        # transitions of all the emulators at once
+        self.Q = QAgent.initialQ(self.grid_cols)
+        self.encoder = ClosestOpponentEncoder(self.grid_cols)
+
+        self.idx2act = np.asarray(self.getActionsSet())
+
+        # Learning rate
+        self.alpha = 0.01
+        # Discounting factor
+        self.gamma = 0.9
+        # Exploration rate
+        self.epsilon = 0.01
+
+        self.next_states = np.zeros(n, np.intp)
+        self.total_rewards = np.zeros(n)
+        self.log = []
+
+    def initialise(self, grids, envs):
+        """ Called at the beginning of the episodes of some of the emulators.
+        Use it to construct their initial states.
+        """
+        self.total_rewards[envs] = 0
+        self.next_states[envs] = self.buildStates(grids)
+
+    def act(self):
+        """ Selects and executes an action in every emulator.
+        """
+        self.states = self.next_states
+        Q_s = self.Q.reshape(-1, 4)[self.states]
+        self.actions = np.argmax(Q_s, axis=1)
+
+        # Explore with a softmax over the actions
+        explore = np.nonzero(np.random.uniform(0., 1., self.n) <
+                             self.epsilon)[0]
+        for i in explore:
+            probs = np.exp(Q_s[i]) / np.sum(np.exp(Q_s[i]))
+            self.actions[i] = np.random.choice(4, p=probs)
+
+        self.rewards = self.move(self.idx2act[self.actions])
+        self.total_rewards += self.rewards
+
+    def sense(self, grids):
+        self.next_states = self.buildStates(grids)
+
+    def learn(self):
+        # Several emulators can update the same state-action value, which
+        # batchUpdate() merges
+        batchUpdate(self.Q, self.states, self.actions, self.rewards,
+                    self.next_states, self.alpha, self.gamma)
+
+    def callback(self, learn, episode, iteration):
+        for i in np.nonzero(self._done)[0]:
+            print "{0}/{1}: {2}".format(i, episode[i], self.total_rewards[i])
+            self.log.append(self.total_rewards[i])
+
+    def buildStates(self, grids):
+        """ Builds the states of QAgent.buildState() for a stack of grids.
+        """
+        return self.encoder.encodeBatch(grids)
+
+
+if __name__ == "__main__":
+    a = VecQAgent(multiprocessing.cpu_count())
+    a.run(True, episodes=500)
+    a.close()
+    print 'Mean total reward: ' + str(np.mean(a.log))